@@ -0,0 +1,120 @@
+import tracemalloc
+
+import diskcache
+import numpy as np
+import plotly.io
+import pytest
+
+from pyq_engine import cache
+from pyq_engine.capture import Capture
+from tests.conftest import write_sigmf
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--sizes', default='1e5,1e6',
+        help='comma separated capture sizes, in samples, e.g. 1e5,1e6,1e7,1e8',
+    )
+
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        sizes = [int(float(s)) for s in metafunc.config.getoption('sizes').split(',')]
+        metafunc.parametrize('size', sizes, ids=[f'{s:.0e}' for s in sizes], scope='session')
+
+
+def synthetic_samples(size, sample_rate=1e6, chunk_size=2**22):
+    '''Generate noise, two tones and periodic bursts, chunk by chunk, so
+    captures larger than memory can be written'''
+    rng = np.random.default_rng(0)
+    for start in range(0, size, chunk_size):
+        n = min(chunk_size, size - start)
+        t = (start + np.arange(n)) / sample_rate
+        samples = 0.01 * (rng.standard_normal(n) + 1j * rng.standard_normal(n))
+        samples += np.exp(2j * np.pi * 100e3 * t) + 0.1 * np.exp(-2j * np.pi * 250e3 * t)
+        # 1ms bursts every 10ms
+        samples += np.where((t % 10e-3) < 1e-3, np.exp(2j * np.pi * 300e3 * t), 0)
+        yield samples.astype(np.complex64)
+
+
+@pytest.fixture(scope='session')
+def capture(tmp_path_factory, size):
+    annotations = [
+        {'core:sample_start': s, 'core:sample_count': 1000, 'core:label': 'burst'}
+        for s in range(0, size, size // 100)
+    ]
+    path = write_sigmf(
+        tmp_path_factory.mktemp('captures') / f'capture-{size}', synthetic_samples(size),
+        frequency=1e9, annotations=annotations,
+    )
+    return Capture.open(path)
+
+
+@pytest.fixture
+def tiles(tmp_path, monkeypatch):
+    '''Empty spectrogram tile cache'''
+    tiles = diskcache.Cache(tmp_path.as_posix())
+    monkeypatch.setattr(cache, 'tiles', tiles)
+    return tiles
+
+
+def limit(size, max_size):
+    '''Skip in-memory benchmarks of captures too large to fit in memory'''
+    if size > max_size:
+        pytest.skip(f'{size} samples processed in memory, over {max_size:.0e}')
+
+
+def peak_memory(func, *args, **kwargs):
+    '''Return the peak memory allocated by a call, in bytes'''
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# extra measurements of each benchmark, reported at the end of the session
+measurements = {}
+
+
+@pytest.fixture
+def measure(request, benchmark):
+    '''Benchmark a call, recording its peak memory, and the JSON payload of
+    the figure it returns if any
+
+    setup is called before each round, out of the timed section.
+    '''
+    def measure(func, *args, setup=None, **kwargs):
+        if setup is not None:
+            setup()
+        benchmark.extra_info['peak_memory'] = peak_memory(func, *args, **kwargs)
+
+        if setup is None:
+            result = benchmark(func, *args, **kwargs)
+        else:
+            def reset():
+                # pedantic() would take a return value as arguments
+                setup()
+
+            result = benchmark.pedantic(func, args=args, kwargs=kwargs, setup=reset, rounds=3)
+
+        if hasattr(result, 'to_plotly_json'):
+            benchmark.extra_info['payload_bytes'] = len(plotly.io.to_json(result))
+
+        measurements[request.node.nodeid] = dict(benchmark.extra_info)
+        return result
+
+    return measure
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not measurements:
+        return
+
+    terminalreporter.section('memory and payload')
+    for name, info in measurements.items():
+        line = f"{name}: peak memory {info['peak_memory'] / 2**20:.1f}MiB"
+        if 'payload_bytes' in info:
+            line += f", payload {info['payload_bytes'] / 2**10:.1f}kiB"
+        terminalreporter.write_line(line)
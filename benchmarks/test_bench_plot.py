@@ -0,0 +1,25 @@
+import pytest
+
+from pyq_engine.components import plot
+from pyq_engine.pyramid import SpectrogramPyramid
+
+
+@pytest.mark.parametrize('precision', ['uint8', 'float32'])
+def test_spectrogram(measure, monkeypatch, tiles, capture, precision):
+    monkeypatch.setattr(plot, 'spectrogram_precision', precision)
+    pyramid = SpectrogramPyramid(capture, 'bench', 1024)
+    pyramid.get(0, len(capture), capture.sample_rate)
+
+    measure(plot.spectrogram, pyramid, capture.metadata, 0, len(capture), segments=capture.segments(), analyze=True)
+
+
+def test_frequencies(measure, capture):
+    measure(plot.frequencies, capture, capture.metadata, fc=1e9, nperseg=1024, analyze=True)
+
+
+def test_time(measure, capture):
+    measure(plot.time, capture, capture.metadata)
+
+
+def test_iq(measure, capture):
+    measure(plot.IQ, capture)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from pyq_engine import utils
+from pyq_engine.pyramid import SpectrogramPyramid
+
+from conftest import limit
+
+
+@pytest.mark.parametrize('nperseg', [256, 1024, 4096])
+def test_spectrogram(measure, capture, size, nperseg):
+    limit(size, 1e7)
+    measure(utils.sigmf_to_spectrogram, capture[:], capture.sample_rate, nperseg=nperseg)
+
+
+@pytest.mark.parametrize('nperseg', [1024, 8192])
+def test_samples_to_psd(measure, capture, nperseg):
+    measure(utils.samples_to_psd, capture, capture.sample_rate, nperseg=nperseg)
+
+
+def test_get_peaks(measure, capture):
+    f, psd = utils.samples_to_psd(capture[:2**20], capture.sample_rate, nperseg=8192)
+    measure(utils.get_peaks, f, psd, prominence=5)
+
+
+def test_detect_bursts(measure, capture, size):
+    limit(size, 1e7)
+    f, spectrogram = utils.sigmf_to_spectrogram(capture[:], capture.sample_rate, nperseg=1024)
+    measure(utils.detect_bursts, f, np.arange(len(spectrogram)), spectrogram)
+
+
+def test_serialize_samples(measure, capture, size):
+    limit(size, 1e7)
+    measure(utils.serialize_samples, capture[:])
+
+
+def test_minmax_decimate(measure, capture, size):
+    limit(size, 1e7)
+    measure(utils.minmax_decimate, capture[:].real, 5000)
+
+
+def test_pyramid_cold(measure, tiles, capture):
+    pyramid = SpectrogramPyramid(capture, 'bench', 1024)
+    measure(pyramid.get, 0, len(capture), capture.sample_rate, setup=tiles.clear)
+
+
+def test_pyramid_warm(measure, tiles, capture):
+    pyramid = SpectrogramPyramid(capture, 'bench', 1024)
+    pyramid.get(0, len(capture), capture.sample_rate)
+    measure(pyramid.get, 0, len(capture), capture.sample_rate)
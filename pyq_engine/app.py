@@ -1,30 +1,69 @@
 import argparse
+import os
+import sys
+from pathlib import Path
+
 import dash_bootstrap_components as dbc
-from dash import Dash, dcc, html, Input, Output, State
+from dash import Dash, DiskcacheManager, dcc, html, Input, Output, State
 
-from pyq_engine import utils
+from pyq_engine import cache
 from pyq_engine import components
+from pyq_engine import metrics
+from pyq_engine import upload
 
 
-def main():
+def parse_args(args=None):
     parser = argparse.ArgumentParser('pyq-engine')
-    parser.add_argument('--debug', default=True, action=argparse.BooleanOptionalAction)
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'serve'], help='run the development server (default), or serve the app with gunicorn workers')
+    parser.add_argument('--debug', default=False, action=argparse.BooleanOptionalAction)
     parser.add_argument('--default-tab', default='spectrogram', choices=['spectrogram', 'frequency', 'iq'])
     parser.add_argument('--fft-size-options', default=[2**i for i in range(5, 15)])
-    options = parser.parse_args()
+    parser.add_argument('--fft-overlap-options', default=[0, 50, 75])
+    parser.add_argument('--time-max-points', type=int, default=components.plot.time_max_points, help='maximum number of points per trace in the time view')
+    parser.add_argument('--iq-bins', type=int, default=components.plot.iq_bins, help='number of bins per axis in the IQ view')
+    parser.add_argument('--spectrogram-precision', default=components.plot.spectrogram_precision, choices=['uint8', 'float32'], help='precision of the spectrogram sent to the browser, uint8 is 4 times smaller, but hovering shows levels instead of dBs')
+    parser.add_argument('--root', type=Path, help='directory captures can be opened from, without uploading them')
+    parser.add_argument('--cache-size', type=int, default=cache.samples.max_bytes, help='server-side sample cache size, in bytes of memory, captures opened from disk only count for their metadata')
+    parser.add_argument('--debug-panel', action='store_true', help='show a panel with the metrics exposed on /metrics')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes, when serving')
+    parser.add_argument('--threads', type=int, default=4, help='number of threads per worker process, when serving')
+    return parser.parse_args(args)
+
+
+def create_app(options):
+    '''Configure the server and build the Dash app
+
+    Everything shared between requests lives on disk, spooled captures and
+    the tiles, figures and jobs caches, so the app can be run by several
+    processes.
+    '''
+    cache.samples.max_bytes = options.cache_size
+    cache.root = options.root
+    components.plot.time_max_points = options.time_max_points
+    components.plot.iq_bins = options.iq_bins
+    components.plot.spectrogram_precision = options.spectrogram_precision
 
     app = Dash(
         __name__,
         title='PYQ-Engine',
         external_stylesheets=[dbc.themes.BOOTSTRAP],
+        # figures are computed in background processes
+        background_callback_manager=DiskcacheManager(cache.jobs.cache),
     )
+    app.server.register_blueprint(upload.blueprint)
+    app.server.register_blueprint(metrics.blueprint)
 
     controls = dbc.Card(
         [
             components.warning.modal,
             components.controls.upload,
+            components.controls.browser(options.root),
             html.Hr(),
             components.controls.fft_size(options.fft_size_options),
+            components.controls.overlap(options.fft_overlap_options),
+            components.controls.channel,
             html.Hr(),
             components.controls.sample_slicer,
             html.Hr(),
@@ -33,6 +72,7 @@ def main():
             html.Hr(),
             components.metadata,
             components.annotations,
+            components.debug(options.debug_panel),
         ],
         body=True,
     )
@@ -52,4 +92,48 @@ def main():
         style={'width': '95vw', 'height': '95vh'},
     )
 
-    app.run(debug=options.debug, host='0.0.0.0')
+    return app
+
+
+def server(*args):
+    '''Return the WSGI app, for WSGI servers to load
+
+    Takes the same arguments as the command line, for example:
+        gunicorn -w 4 "pyq_engine.app:server('--root', '/data')"
+    '''
+    return create_app(parse_args(args)).server
+
+
+def serve(app, options):
+    '''Serve the app with gunicorn, with several worker processes'''
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('serving requires gunicorn, install pyq-engine with the serve extra')
+
+    class Application(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{options.host}:{options.port}')
+            self.cfg.set('workers', options.workers)
+            self.cfg.set('threads', options.threads)
+            # uploads are sent in chunks, no request should take that long
+            self.cfg.set('timeout', 120)
+
+        def load(self):
+            return app.server
+
+    Application().run()
+
+
+def main():
+    options = parse_args()
+
+    # counters are shared by all the workers, only start them over once,
+    # before any worker is forked, and never when a worker restarts
+    metrics.store.clear()
+    app = create_app(options)
+
+    if options.command == 'serve':
+        serve(app, options)
+    else:
+        app.run(debug=options.debug, host=options.host, port=options.port)
@@ -0,0 +1,70 @@
+// Chunked and resumable upload of captures, see pyq_engine/upload.py.
+//
+// Files are sent as raw chunks instead of a base64 data URL, so they never
+// have to fit in the browser or server memory. Dash is notified through
+// upload-store once the upload completes.
+(function() {
+    const CHUNK_SIZE = 8 * 1024 * 1024;
+
+    function setProgress(value, label, color) {
+        window.dash_clientside.set_props('upload-progress', {
+            value: value,
+            label: label,
+            color: color || 'primary',
+        });
+    }
+
+    async function upload(file) {
+        let response = await fetch('upload', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                name: file.name,
+                size: file.size,
+                modified: file.lastModified,
+            }),
+        });
+        let status = await response.json();
+
+        while (!status.done) {
+            const percent = file.size ? Math.floor(100 * status.offset / file.size) : 0;
+            setProgress(percent, `${percent}%`);
+
+            const chunk = file.slice(status.offset, status.offset + CHUNK_SIZE);
+            response = await fetch(`upload/${status.key}?offset=${status.offset}&size=${file.size}`, {
+                method: 'PUT',
+                body: chunk,
+            });
+
+            // 409 means the server expects another offset, resume from there
+            if (!response.ok && response.status !== 409) {
+                throw new Error(`upload failed: ${response.status} ${response.statusText}`);
+            }
+            status = await response.json();
+        }
+
+        setProgress(100, file.name);
+        window.dash_clientside.set_props('upload-store', {
+            data: {key: status.key, filename: file.name},
+        });
+    }
+
+    document.addEventListener('click', function(event) {
+        if (!event.target.closest('#upload-button')) {
+            return;
+        }
+
+        const input = document.createElement('input');
+        input.type = 'file';
+        input.accept = '.sigmf';
+        input.addEventListener('change', function() {
+            if (input.files.length) {
+                upload(input.files[0]).catch(function(error) {
+                    console.error(error);
+                    setProgress(100, 'Upload failed', 'danger');
+                });
+            }
+        });
+        input.click();
+    });
+})();
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from pathlib import Path
+
+import diskcache
+import numpy as np
+
+from pyq_engine import utils
+from pyq_engine.capture import Capture
+
+
+class SampleCache:
+    '''Server-side LRU cache of samples, bounded by size in bytes
+
+    Values are sample arrays, stored read-only, or memory-mapped captures.
+    They are returned as-is, so callers get a view of the cached buffer
+    without any copy. Only the key needs to go through the browser.
+
+    Arrays count for their size, memory-mapped captures for their metadata
+    only, their samples are in the page cache, which the OS reclaims as
+    needed. The number of entries is bounded too, each capture keeping its
+    file mapped.
+    '''
+
+    def __init__(self, max_bytes=2**30, max_entries=256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def nbytes(self):
+        return sum(self._sizes.values())
+
+    @staticmethod
+    def entry_size(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        return len(json.dumps(value.metadata)) + value.segment_index.nbytes
+
+    def put(self, samples, key: str = None) -> str:
+        '''Add samples to the cache, and return their key'''
+        if key is None:
+            key = uuid.uuid4().hex
+
+        if isinstance(samples, np.ndarray):
+            samples = samples.view()
+            samples.flags.writeable = False
+
+        size = self.entry_size(samples)
+        with self._lock:
+            self._entries[key] = samples
+            self._sizes[key] = size
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+
+        return key
+
+    def get(self, key: str):
+        '''Return the samples stored under key, or None if evicted'''
+        with self._lock:
+            samples = self._entries.get(key)
+            if samples is not None:
+                self._entries.move_to_end(key)
+        return samples
+
+    def _evict(self, keep):
+        # the most recent entry is always kept, even if it's too large
+        while (self.nbytes > self.max_bytes or len(self._entries) > self.max_entries) and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            if key == keep:
+                break
+            del self._entries[key]
+            del self._sizes[key]
+
+
+class PSDCache:
+    '''Cache of whole capture PSDs, in memory and optionally on disk
+
+    PSDs are keyed by capture path and modification time, so they are
+    computed again when the capture changes.
+
+    Args:
+        directory:
+            directory holding cached PSDs, not persisted if None
+        max_bytes:
+            size of the in-memory cache
+    '''
+
+    def __init__(self, directory=None, max_bytes=2**27):
+        self.directory = Path(directory) if directory is not None else None
+        self.memory = SampleCache(max_bytes=max_bytes)
+
+    def key(self, path, nperseg, rf_freq):
+        path = Path(path)
+        mtimes = [p.stat().st_mtime for p in (path.with_suffix('.sigmf-meta'), path.with_suffix('.sigmf-data')) if p.exists()]
+        if path.suffix == '.sigmf':
+            mtimes = [path.stat().st_mtime]
+
+        key = json.dumps([path.resolve().as_posix(), mtimes, nperseg, rf_freq])
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key):
+        psd = self.memory.get(key)
+        if psd is None and self.directory is not None:
+            path = self.directory / (key + '.npy')
+            if path.exists():
+                psd = np.load(path)
+                self.memory.put(psd, key=key)
+        return psd
+
+    def put(self, key, psd):
+        self.memory.put(psd, key=key)
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            np.save(self.directory / (key + '.npy'), psd)
+
+    def get_many(self, paths, nperseg=1024, rf_freq=True, map_=map):
+        '''Return the PSDs of paths, computing the missing ones with map_
+
+        Pass the map() method of an executor to compute PSDs in parallel.
+
+        Returns:
+            A list of (2, nperseg) arrays, see utils.capture_psd().
+        '''
+        keys = [self.key(p, nperseg, rf_freq) for p in paths]
+        psds = [self.get(k) for k in keys]
+
+        missing = [i for i, psd in enumerate(psds) if psd is None]
+        computed = map_(utils.capture_psd, [paths[i] for i in missing], [nperseg] * len(missing), [rf_freq] * len(missing))
+        for i, psd in zip(missing, computed):
+            self.put(keys[i], psd)
+            psds[i] = psd
+
+        return psds
+
+
+class DiskCache:
+    '''A diskcache.Cache in cache_dir, opened on first use
+
+    Importing a module holding caches creates nothing on disk, the command
+    line tools importing this module don't need them.
+    '''
+
+    def __init__(self, name, **settings):
+        self.name = name
+        self.settings = settings
+        self._cache = None
+
+    @property
+    def cache(self) -> diskcache.Cache:
+        if self._cache is None:
+            self._cache = diskcache.Cache((cache_dir / self.name).as_posix(), **self.settings)
+        return self._cache
+
+    def __getattr__(self, name):
+        return getattr(self.cache, name)
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __iter__(self):
+        return iter(self.cache)
+
+
+def user_dir(kind='cache'):
+    '''Return the per-user directory of the server and command line tools
+
+    Following the XDG base directory specification, 'cache' is for files
+    that can be computed again, and 'state' for results worth keeping.
+    Captures directories may be read-only, nothing is written in them.
+    '''
+    variable, default = {
+        'cache': ('XDG_CACHE_HOME', '.cache'),
+        'state': ('XDG_STATE_HOME', '.local/state'),
+    }[kind]
+    return Path(os.environ.get(variable) or Path.home() / default) / 'pyq-engine'
+
+
+# the server only writes in per-user directories, diskcache unpickles what
+# it reads, and other users shouldn't be able to write there
+spool_dir = user_dir() / 'spool'
+spool_max_age = 24 * 60 * 60
+# directory captures can be opened from by path, disabled if None
+root = None
+samples = SampleCache()
+
+# on-disk caches, shared by the processes running background callbacks
+cache_dir = user_dir() / 'server'
+# part of the keys of tiles and figures, bump it when their format changes,
+# so that entries written by other versions are never read
+version = 2
+tiles = DiskCache('tiles', size_limit=2**28)
+figures = DiskCache('figures', size_limit=2**28)
+jobs = DiskCache('jobs')
+# latest request of each session
+requests = DiskCache('requests')
+
+
+def clean_spool():
+    '''Remove spooled files older than spool_max_age seconds'''
+    if not spool_dir.exists():
+        return
+
+    now = time.time()
+    for f in spool_dir.iterdir():
+        if now - f.stat().st_mtime > spool_max_age:
+            f.unlink(missing_ok=True)
+
+
+def spool_path(key: str, suffix: str = '.sigmf') -> Path:
+    '''Return the path of a spooled file, creating the spool directory'''
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    return spool_dir / (key + suffix)
+
+
+def is_spool_key(key: str) -> bool:
+    '''Return whether key is a valid key of a spooled file, see
+    upload.upload_key()'''
+    return re.fullmatch('[0-9a-f]{40}', key) is not None
+
+
+def root_path(relative: str) -> Path:
+    '''Return the path of a file in root, refusing paths outside of it'''
+    if root is None:
+        raise ValueError('opening captures by path is disabled')
+
+    path = (Path(root) / relative).resolve()
+    if not path.is_relative_to(Path(root).resolve()):
+        raise ValueError(f'{relative} is outside of the capture directory')
+
+    return path
+
+
+def split_path_key(key: str):
+    '''Return the relative path and the version of a 'path:' key, the
+    version is None if the key has none'''
+    relative, version = re.fullmatch('path:(.*?)(?:@([0-9a-f]{40}))?', key).groups()
+    return relative, version
+
+
+def capture_key(key: str) -> str:
+    '''Return the key of the current content of a capture
+
+    Captures opened from root can be rewritten, or still be recording, their
+    key is versioned with the modification time and size of their files,
+    like PSDCache.key() does, so that the samples, tiles and figures cached
+    for a previous content are never used again. Uploads never change, their
+    key is returned as-is.
+    '''
+    if not key.startswith('path:'):
+        return key
+
+    relative, _ = split_path_key(key)
+    path = root_path(relative)
+    files = [path] if path.suffix == '.sigmf' else [path.with_suffix('.sigmf-meta'), path.with_suffix('.sigmf-data')]
+    stats = [(p.stat().st_mtime_ns, p.stat().st_size) for p in files if p.exists()]
+
+    version = hashlib.sha1(json.dumps(stats).encode()).hexdigest()
+    return f'path:{relative}@{version}'
+
+
+def get_capture(key: str) -> Capture:
+    '''Return the capture stored under key
+
+    Keys starting with 'path:' refer to a capture in the root directory,
+    other keys to an uploaded capture in the spool directory. Captures
+    evicted from the cache, or opened by another process, are memory-mapped
+    again from disk. Returns None if the capture no longer exists, or if the
+    key is of a previous version of it, see capture_key(), and raises
+    ValueError for keys that are neither.
+    '''
+    if key.startswith('path:'):
+        current = capture_key(key)
+        if split_path_key(key)[1] is not None and key != current:
+            return None
+        key = current
+    elif not is_spool_key(key):
+        # keys come from the browser, don't let them escape the spool directory
+        raise ValueError(f'invalid capture key: {key}')
+
+    capture = samples.get(key)
+    if capture is not None:
+        return capture
+
+    if key.startswith('path:'):
+        path = root_path(split_path_key(key)[0])
+        if not path.exists():
+            return None
+    else:
+        # skip partial uploads
+        path = next((p for p in spool_dir.glob(key + '.*') if p.suffix != '.part'), None)
+        if path is None:
+            return None
+
+    capture = Capture.open(path)
+    samples.put(capture, key=key)
+    return capture
+
+
+def new_request(session: str) -> int:
+    '''Register a new request of a session, superseding its previous ones,
+    and return its generation'''
+    generation = requests.incr(session)
+    requests.touch(session, expire=spool_max_age)
+    return generation
+
+
+def latest_request(session: str, generation: int):
+    '''Return a check of whether a request is the latest one of its session
+
+    Returns:
+        A function returning whether the request registered as generation,
+        in any process, is still the latest one of the session, for stale
+        requests to give up as early as possible.
+    '''
+    return lambda: requests.get(session) == generation
@@ -0,0 +1,235 @@
+import copy
+import json
+import tarfile
+
+from pathlib import Path
+
+import numpy as np
+
+
+def parse_datatype(datatype: str) -> tuple[np.dtype, bool]:
+    '''Parse a SigMF datatype string
+
+    Args:
+        datatype:
+            SigMF core:datatype, for example 'cf32_le' or 'ci16_le'
+
+    Returns:
+        A tuple with the numpy dtype of a single component, and a flag set
+        for complex datatypes.
+    '''
+    kind, _, endianness = datatype.partition('_')
+    is_complex = kind[0] == 'c'
+
+    if kind[0] not in 'cr' or kind[1] not in 'fiu':
+        raise ValueError(f'unsupported datatype: {datatype}')
+
+    byteorder = {'le': '<', 'be': '>', '': '|'}[endianness]
+    dtype = np.dtype({'f': 'float', 'i': 'int', 'u': 'uint'}[kind[1]] + kind[2:])
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder(byteorder)
+
+    return dtype, is_complex
+
+
+segment_dtype = np.dtype([
+    ('start', np.int64),
+    ('stop', np.int64),
+    ('frequency', np.float64),
+])
+
+
+def segment_index(captures, length):
+    '''Build the index of the capture segments of a recording
+
+    Args:
+        captures:
+            SigMF captures list
+        length:
+            number of samples of the recording
+
+    Returns:
+        A structured array of segment_dtype, one entry per capture segment
+        ordered by start sample, each one ending where the next one starts.
+    '''
+    captures = sorted(captures, key=lambda c: c.get('core:sample_start', 0)) or [{}]
+
+    segments = np.empty(len(captures), dtype=segment_dtype)
+    segments['start'] = [c.get('core:sample_start', 0) for c in captures]
+    segments['stop'][:-1] = segments['start'][1:]
+    segments['stop'][-1] = max(length, segments['start'][-1])
+    segments['frequency'] = [c.get('core:frequency', 0) for c in captures]
+    return segments
+
+
+class Capture:
+    '''Memory-mapped SigMF capture
+
+    Samples are read from disk on access, so captures of any size can be
+    opened and sliced without loading them in memory.
+
+    Samples of multi-channel recordings are interleaved, a Capture reads a
+    single channel, see channel(). Capture segments are indexed once when
+    opening, see segments().
+
+    Args:
+        path:
+            file holding the sample data
+        metadata:
+            SigMF metadata, as a dict
+        offset:
+            offset of the sample data in path, in bytes
+        size:
+            size of the sample data in bytes, defaults to the rest of the file
+    '''
+
+    def __init__(self, path, metadata, offset=0, size=None):
+        self.path = Path(path)
+        self.metadata = metadata
+
+        self.dtype, self.is_complex = parse_datatype(self.datatype)
+        if size is None:
+            size = self.path.stat().st_size - offset
+
+        # samples of all the channels are interleaved
+        shape = (self.num_channels, 2) if self.is_complex else (self.num_channels, )
+        components = size // self.dtype.itemsize
+        components -= components % int(np.prod(shape))
+
+        if components:
+            memmap = np.memmap(self.path, dtype=self.dtype, mode='r', offset=offset, shape=(components,))
+        else:
+            memmap = np.empty(0, dtype=self.dtype)
+
+        # (samples, channels[, 2]), a channel is read through a strided view
+        self._channels = memmap.reshape(-1, *shape)
+        self._memmap = self._channels[:, 0]
+        self._start = 0
+
+        self.segment_index = segment_index(metadata.get('captures', []), len(self))
+
+    @classmethod
+    def open(cls, path):
+        '''Open a .sigmf archive, or a .sigmf-meta/.sigmf-data pair'''
+        path = Path(path)
+
+        if path.suffix == '.sigmf':
+            return cls._open_archive(path)
+
+        meta = path.with_suffix('.sigmf-meta')
+        with open(meta) as f:
+            metadata = json.load(f)
+
+        return cls(path.with_suffix('.sigmf-data'), metadata)
+
+    @classmethod
+    def _open_archive(cls, path):
+        try:
+            tar = tarfile.open(path, mode='r:')
+        except tarfile.ReadError as e:
+            raise ValueError(f'{path.name} is not an uncompressed SigMF archive: {e}')
+
+        with tar:
+            members = tar.getmembers()
+            meta = next((m for m in members if m.name.endswith('.sigmf-meta')), None)
+            data = next((m for m in members if m.name.endswith('.sigmf-data')), None)
+
+            if meta is None or data is None:
+                raise ValueError(f'{path.name} is missing a .sigmf-meta or .sigmf-data file')
+
+            metadata = json.load(tar.extractfile(meta))
+
+        return cls(path, metadata, offset=data.offset_data, size=data.size)
+
+    @property
+    def datatype(self):
+        return self.metadata['global']['core:datatype']
+
+    @property
+    def sample_rate(self):
+        return self.metadata['global']['core:sample_rate']
+
+    @property
+    def num_channels(self):
+        return self.metadata['global'].get('core:num_channels', 1)
+
+    def __len__(self):
+        return self._memmap.shape[0]
+
+    def slice(self, start, stop):
+        '''Return a capture of samples [start, stop), without reading them'''
+        start, stop, _ = slice(start, stop).indices(len(self))
+        capture = copy.copy(self)
+        capture._channels = self._channels[start:stop]
+        capture._memmap = self._memmap[start:stop]
+        capture._start = self._start + start
+        return capture
+
+    def channel(self, channel):
+        '''Return a capture of one channel of a multi-channel recording'''
+        if not 0 <= channel < self.num_channels:
+            raise ValueError(f'no channel {channel}, the capture has {self.num_channels}')
+
+        capture = copy.copy(self)
+        capture._memmap = self._channels[:, channel]
+        return capture
+
+    def segments(self, start=0, stop=None):
+        '''Return the capture segments overlapping samples [start, stop)
+
+        Only the index built when opening is looked up, no sample is read.
+
+        Returns:
+            A structured array of segment_dtype, with the start and stop of
+            each segment clipped to [start, stop).
+        '''
+        start, stop, _ = slice(start, stop).indices(len(self))
+
+        # segment_index is in samples of the whole recording
+        index = self.segment_index
+        first = min(np.searchsorted(index['stop'], self._start + start, side='right'), len(index) - 1)
+        last = np.searchsorted(index['start'], self._start + stop, side='left')
+
+        segments = index[first:max(last, first + 1)].copy()
+        segments['start'] = np.maximum(segments['start'] - self._start, start)
+        segments['stop'] = np.minimum(segments['stop'] - self._start, stop)
+        return segments
+
+    def frequency(self, sample=0):
+        '''Return the center frequency at a sample'''
+        return self.segments(sample, sample + 1)['frequency'][0]
+
+    def chunks(self, chunk_size=2**22):
+        '''Iterate over the samples, chunk_size samples at a time
+
+        Samples are kept in their native datatype on disk, and converted
+        one chunk at a time, so memory use doesn't depend on the capture
+        size.
+        '''
+        for start in range(0, len(self), chunk_size):
+            yield self[start:start + chunk_size]
+
+    def __getitem__(self, sli):
+        '''Return samples as complex64, or float32 for real datatypes
+
+        Integer samples are scaled to [-1.0, 1.0), as sigmf does. Little
+        endian complex float data is returned as a view of the file,
+        everything else is converted, so slices should be kept small, see
+        chunks().
+        '''
+        raw = self._memmap[sli]
+
+        if self.dtype == np.dtype('<f4') and self.is_complex:
+            return raw.view(np.complex64).reshape(raw.shape[:-1])
+
+        data = raw.astype(np.float32)
+        if self.dtype.kind in 'iu':
+            bits = self.dtype.itemsize * 8
+            if self.dtype.kind == 'u':
+                data -= 2 ** (bits - 1)
+            data *= 2 ** -(bits - 1)
+
+        if self.is_complex:
+            data = data.view(np.complex64).reshape(data.shape[:-1])
+
+        return data
@@ -1,6 +1,7 @@
 from . import controls
 from .annotations import annotations
 from .metadata import metadata
+from .debug import debug
 from .tabs import tabs
 from . import plot
 from . import warning
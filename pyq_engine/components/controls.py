@@ -1,7 +1,10 @@
-from dash import callback, dcc, html, Input, Output, State
+from pathlib import Path
+
+from dash import callback, clientside_callback, dcc, html, no_update, Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 
-from pyq_engine import utils
+from pyq_engine import cache
 from pyq_engine.components import warning, button
 
 
@@ -9,8 +12,13 @@ upload = html.Div(
     [
         dcc.Store(id='samples-store'),
         dcc.Store(id='metadata-store'),
-        dcc.Upload(
-            id='filename',
+        # identifies the browser tab, only its latest request is computed
+        dcc.Store(id='session-id', storage_type='session'),
+        # capture to open, uploaded or picked from the server
+        dcc.Store(id='upload-store'),
+        # files are picked and uploaded in chunks by assets/upload.js
+        html.Div(
+            id='upload-button',
             children=html.Div([
                 html.A('Upload Archive')
             ]),
@@ -22,12 +30,58 @@ upload = html.Div(
                 'borderStyle': 'dashed',
                 'borderRadius': '5px',
                 'textAlign': 'center',
+                'cursor': 'pointer',
+            },
+        ),
+        dbc.Progress(
+            id='upload-progress',
+            value=0,
+            style={
+                'margin-top': '5px',
             },
         ),
     ],
 )
 
 
+def browser(root):
+    return html.Div(
+        [
+            dcc.Store(id='browser-dir', data=''),
+            dbc.Label('Open from Server'),
+            dcc.Dropdown(
+                id='browser',
+                placeholder='Browse captures...',
+            ),
+        ],
+        style={
+            'margin-top': '10px',
+            'display': 'block' if root is not None else 'none',
+        },
+    )
+
+
+def list_directory(relative):
+    '''Return dropdown options for the sub-directories and captures of a
+    directory of the capture root'''
+    options = []
+    if relative:
+        parent = Path(relative).parent.as_posix()
+        options.append({'label': '..', 'value': 'dir:' + ('' if parent == '.' else parent)})
+
+    for p in sorted(cache.root_path(relative).iterdir()):
+        if p.name.startswith('.'):
+            continue
+
+        rel = Path(relative, p.name).as_posix()
+        if p.is_dir():
+            options.append({'label': p.name + '/', 'value': 'dir:' + rel})
+        elif p.suffix in ('.sigmf', '.sigmf-meta'):
+            options.append({'label': p.name, 'value': 'path:' + rel})
+
+    return options
+
+
 def fft_size(options):
     return html.Div(
         [
@@ -40,6 +94,51 @@ def fft_size(options):
         ],
     )
 
+
+def overlap(options):
+    return html.Div(
+        [
+            dbc.Label('FFT Overlap'),
+            dcc.Dropdown(
+                id='fft-overlap',
+                options=[{'label': f'{o}%', 'value': o} for o in options],
+                value=0,
+            ),
+        ],
+    )
+
+
+# only shown for multi-channel recordings
+channel = html.Div(
+    [
+        dbc.Label('Channel'),
+        dcc.Dropdown(
+            id='channel',
+            options=[0],
+            value=0,
+            clearable=False,
+        ),
+    ],
+    id='channel-selector',
+    style={
+        'display': 'none',
+    },
+)
+
+
+@callback(
+    [
+        Output('channel', 'options'),
+        Output('channel', 'value'),
+        Output('channel-selector', 'style'),
+    ],
+    Input('metadata-store', 'data'),
+)
+def update_channels(metadata):
+    channels = (metadata or {}).get('global', {}).get('core:num_channels', 1)
+    return list(range(channels)), 0, {'display': 'block' if channels > 1 else 'none'}
+
+
 switches = html.Div(
     [
         button.OnOff(label='RF Frequencies', id='rf-freq', on=True),
@@ -71,6 +170,10 @@ def toggle_modal(n, is_open):
     return is_open
 
 
+# initial width of the sample slice, captures are never truncated but
+# computing views over very large slices takes a while
+default_slice = int(1e6)
+
 sample_slicer = html.Div(
     [
         dbc.Label('Sample Slice'),
@@ -79,6 +182,8 @@ sample_slicer = html.Div(
             value=[10, 20],
             marks=None,
             allowCross=False,
+            # only update the views once the handle is released
+            updatemode='mouseup',
             tooltip={'placement': 'bottom', 'always_visible': True},
             id='cursor',
         ),
@@ -86,6 +191,18 @@ sample_slicer = html.Div(
 )
 
 
+clientside_callback(
+    '''
+    function(upload, id) {
+        return id || Math.random().toString(36).slice(2) + Date.now().toString(36);
+    }
+    ''',
+    Output('session-id', 'data'),
+    Input('upload-store', 'data'),
+    State('session-id', 'data'),
+)
+
+
 @callback(
     [
         Output('samples-store', 'data'),
@@ -93,35 +210,59 @@ sample_slicer = html.Div(
         Output('warning-modal', 'is_open'),
         Output('warning-modal', 'children'),
     ],
-    [
-        Input('filename', 'filename'),
-        Input('filename', 'contents'),
-    ],
+    Input('upload-store', 'data'),
 )
-def load_file(filename, contents):
-    limit = int(1e6)
-    w = None
-    if not filename:
+def load_file(upload):
+    if not upload:
         return None, None, False, []
 
+    key = upload['key']
     try:
-        sigmf = utils.load_sigmf_contents(contents)
+        capture = cache.get_capture(key)
     except Exception as e:
         return (
             None, None, True,
             warning.warn('SigMF Error', 'Unable to open SigMFArchive: ' + str(e)),
         )
 
-    samples = sigmf[:]
-    if samples.shape[0] > limit:
-        w = warning.warn('SigMF Warning', f'Truncating samples for performance {samples.shape[0]} -> ({limit},)')
-        samples = samples[:limit]
+    if capture is None:
+        return (
+            None, None, True,
+            warning.warn('SigMF Error', 'Capture not found on the server, please open it again'),
+        )
 
-    return (
-        utils.serialize_samples(samples),
-        sigmf._metadata,
-        w is not None, w,
-    )
+    store = {
+        'key': key,
+        'filename': upload['filename'],
+        'count': len(capture),
+    }
+
+    return store, capture.metadata, False, []
+
+
+@callback(
+    [
+        Output('browser-dir', 'data'),
+        Output('browser', 'options'),
+        Output('browser', 'value'),
+        Output('upload-store', 'data'),
+    ],
+    Input('browser', 'value'),
+    State('browser-dir', 'data'),
+)
+def browse(value, directory):
+    """
+    Selecting a directory lists its content, selecting a capture opens it
+    directly from the server, like an upload would.
+    """
+    if cache.root is None:
+        raise PreventUpdate
+
+    if value is None or value.startswith('dir:'):
+        directory = value.removeprefix('dir:') if value else directory
+        return directory, list_directory(directory), None, no_update
+
+    return no_update, no_update, no_update, {'key': value, 'filename': Path(value.removeprefix('path:')).name}
 
 
 @callback(
@@ -135,6 +276,6 @@ def update_sample_slice(samples):
     if samples is None:
         return 5000, [0, 5000]
 
-    count = utils.deserialize_samples(samples).shape[0]
+    count = samples['count']
 
-    return count, [0, count]
+    return count, [0, min(count, default_slice)]
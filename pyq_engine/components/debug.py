@@ -0,0 +1,104 @@
+from dash import callback, dash_table, dcc, html, Input, Output, State
+import dash_bootstrap_components as dbc
+
+from pyq_engine import metrics
+
+
+def debug(enabled):
+    return html.Div(
+        [
+            dbc.Button(
+                'Show Metrics',
+                id='debug-button',
+                color='secondary',
+                n_clicks=0,
+                style={
+                    'width': '100%',
+                    'margin-bottom': '10px',
+                },
+            ),
+            dbc.Modal(
+                [
+                    dbc.ModalHeader(dbc.ModalTitle('Metrics')),
+                    dbc.ModalBody(id='debug-metrics'),
+                ],
+                id='debug-modal',
+                size='xl',
+                is_open=False,
+            ),
+            dcc.Interval(id='debug-interval', interval=2000, disabled=True),
+        ],
+        style={
+            'display': 'block' if enabled else 'none',
+        },
+    )
+
+
+@callback(
+    Output('debug-modal', 'is_open'),
+    Output('debug-interval', 'disabled'),
+    Input('debug-button', 'n_clicks'),
+    State('debug-modal', 'is_open'),
+    prevent_initial_call=True,
+)
+def toggle_debug_modal(n, is_open):
+    return not is_open, is_open
+
+
+def table(rows, columns):
+    return dash_table.DataTable(
+        data=rows,
+        columns=[{'name': c, 'id': c} for c in columns],
+        style_cell={'textAlign': 'left', 'fontFamily': 'monospace'},
+    )
+
+
+@callback(
+    Output('debug-metrics', 'children'),
+    Input('debug-interval', 'n_intervals'),
+    Input('debug-modal', 'is_open'),
+)
+def update_debug_metrics(n, is_open):
+    """
+    Summarize the metrics exposed on /metrics, while the panel is open.
+    """
+    if not is_open:
+        return []
+
+    m = metrics.collect()
+
+    timings = []
+    for name in ('pyq_engine_stage_seconds', 'pyq_engine_callback_seconds'):
+        for label, h in sorted(m[name].items()):
+            timings.append({
+                'name': label,
+                'count': h['count'],
+                'mean (ms)': round(1e3 * h['sum'] / max(h['count'], 1), 1),
+                'total (s)': round(h['sum'], 3),
+            })
+
+    hits, misses = m['pyq_engine_cache_hits_total'], m['pyq_engine_cache_misses_total']
+    caches = [
+        {
+            'cache': c,
+            'hits': hits.get(c, 0),
+            'misses': misses.get(c, 0),
+            'hit rate': f'{hits.get(c, 0) / (hits.get(c, 0) + misses.get(c, 0)):.0%}',
+        }
+        for c in sorted(hits.keys() | misses.keys())
+    ]
+
+    received, sent = m['pyq_engine_callback_request_bytes_total'], m['pyq_engine_callback_response_bytes_total']
+    payloads = [
+        {'callback': c, 'bytes in': received.get(c, 0), 'bytes out': sent.get(c, 0)}
+        for c in sorted(received.keys() | sent.keys())
+    ]
+
+    return [
+        html.H5('Timings'),
+        table(timings, ['name', 'count', 'mean (ms)', 'total (s)']),
+        html.H5('Caches', style={'margin-top': '20px'}),
+        table(caches, ['cache', 'hits', 'misses', 'hit rate']),
+        html.H5('Payloads', style={'margin-top': '20px'}),
+        table(payloads, ['callback', 'bytes in', 'bytes out']),
+    ]
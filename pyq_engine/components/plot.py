@@ -3,10 +3,73 @@ import numpy as np
 import plotly.graph_objs as go
 import plotly.express as px
 
-from pyq_engine import utils
+from pyq_engine import metrics, utils
+from pyq_engine.capture import segment_dtype
 
 
-def IQ(samples, title=None, decimate=10):
+# number of bins per axis of the IQ density plot
+iq_bins = 256
+
+
+# number of samples converted at a time, when building figures from captures
+chunk_size = 2**22
+
+
+def IQ(samples, title=None, decimate=10, mode='density', bins=None):
+    if mode == 'scatter':
+        return IQ_scatter(samples[:], title=title, decimate=decimate)
+
+    bins = bins or iq_bins
+
+    # samples is a Capture, read one chunk at a time. Integer samples are
+    # scaled to their full scale when read, others are read once more to
+    # find their scale
+    scale = 1
+    if samples.dtype.kind == 'f':
+        scale = 0
+        for chunk in samples.chunks(chunk_size):
+            scale = max(scale, np.max(np.abs(np.real(chunk)), initial=0), np.max(np.abs(np.imag(chunk)), initial=0))
+        scale = scale or 1
+
+    edges = np.linspace(-1, 1, bins + 1)
+    counts = np.zeros((bins, bins))
+    for chunk in samples.chunks(chunk_size):
+        counts += np.histogram2d(np.real(chunk) / scale, np.imag(chunk) / scale, bins=[edges, edges])[0]
+    centers = (edges[:-1] + edges[1:]) / 2
+
+    # leave empty bins transparent
+    counts[counts == 0] = np.nan
+
+    fig = go.Figure(go.Heatmap(
+        x0=centers[0],
+        dx=centers[1] - centers[0],
+        y0=centers[0],
+        dy=centers[1] - centers[0],
+        z=counts.T.astype(np.float32),
+        colorscale='viridis',
+        colorbar_title='Count',
+        hovertemplate='I=%{x:.3f}<br>Q=%{y:.3f}<br>count=%{z}<extra></extra>',
+    ))
+
+    fig.add_shape(
+        type='circle',
+        xref='x',
+        yref='y',
+        x0=-1, y0=-1, x1=1, y1=1,
+        name='unit circle',
+    )
+
+    fig.update_layout(
+        title=title,
+        xaxis_title='I',
+        yaxis_title='Q',
+        yaxis_scaleanchor='x',
+    )
+
+    return fig
+
+
+def IQ_scatter(samples, title=None, decimate=10):
     samples = samples[::decimate]
 
     fig = px.scatter(
@@ -35,23 +98,38 @@ def IQ(samples, title=None, decimate=10):
     return fig
 
 
-def time(samples, metadata, title=None):
-    sample_count = len(samples)
-    sample_rate = metadata['global']['core:sample_rate']
-    xtime = np.linspace(0.0, float(sample_count / sample_rate), num=sample_count)
+# maximum number of points per trace of the time domain plot
+time_max_points = 5000
 
-    fig = go.Figure(data=[
-        go.Scatter(
-            x=xtime,
-            y=np.real(samples),
-            name='I',
-        ),
-        go.Scatter(
-            x=xtime,
-            y=np.imag(samples),
-            name='Q',
-        )
-    ])
+
+def time(samples, metadata, title=None, offset=0, max_points=None):
+    sample_rate = metadata['global']['core:sample_rate']
+    max_points = max_points or time_max_points
+
+    # samples is a Capture, decimated one chunk at a time, with chunks made
+    # of whole buckets
+    n = len(samples)
+    size = -(-n // (max_points // 2)) if n > max_points else 1
+    step = size * max(1, chunk_size // size)
+
+    points = {'I': ([], []), 'Q': ([], [])}
+    for i, chunk in enumerate(samples.chunks(step)):
+        start = i * step
+        for name, y in [('I', np.real(chunk)), ('Q', np.imag(chunk))]:
+            idxs = utils.minmax_buckets(y, size) if size > 1 else np.arange(len(y))
+            points[name][0].append(start + idxs)
+            points[name][1].append(y[idxs])
+
+    traces = []
+    for name, (idxs, y) in points.items():
+        idxs = np.concatenate(idxs) if idxs else np.empty(0, dtype=int)
+        traces.append(go.Scatter(
+            x=(offset + idxs) / sample_rate,
+            y=np.concatenate(y).astype(np.float32) if y else np.empty(0, dtype=np.float32),
+            name=name,
+        ))
+
+    fig = go.Figure(data=traces, layout_title=title)
 
     fig.update_layout(
         hovermode='x unified',
@@ -63,68 +141,210 @@ def time(samples, metadata, title=None):
     return fig
 
 
-def draw_spectrogram_annotation(figure, annotation, frequency=None, time=None):
-    y0 = annotation['core:sample_start']
-    y1 = annotation['core:sample_count']
+def draw_spectrogram_annotations(figure, annotations, frequency, sample_rate, start, stop, offset=0):
+    '''Draw the annotations overlapping samples [start, stop) as a single
+    trace, rectangles separated by NaNs and clipped to the slice
+
+    Annotations without a sample count extend to the end of the capture,
+    and annotations without frequency edges cover the whole band. offset is
+    subtracted from the frequency edges, for views not in RF frequencies.
+
+    Views spanning several capture segments pass start, stop and offset as
+    arrays, and frequency as a (segments, bins) array, with one entry per
+    segment. Annotations are then clipped to each segment they overlap.
+    '''
+    if not annotations:
+        return
+
+    start, stop, offset = np.broadcast_arrays(*(np.atleast_1d(np.asarray(v, dtype=np.float64)) for v in (start, stop, offset)))
+    frequency = np.broadcast_to(np.atleast_2d(frequency), (len(start), np.shape(frequency)[-1]))
+
+    s0 = np.array([a['core:sample_start'] for a in annotations], dtype=np.float64)
+    s1 = s0 + np.array([a.get('core:sample_count', np.inf) for a in annotations], dtype=np.float64)
+    # one rectangle per annotation and segment it overlaps
+    i, k = np.nonzero((s0[:, None] < stop) & (s1[:, None] > start))
+    if not len(i):
+        return
+
+    y0 = np.maximum(s0[i], start[k]) / sample_rate
+    y1 = np.minimum(s1[i], stop[k]) / sample_rate
+    x0 = np.array([a.get('core:freq_lower_edge', np.nan) for a in annotations], dtype=np.float64)[i] - offset[k]
+    x1 = np.array([a.get('core:freq_upper_edge', np.nan) for a in annotations], dtype=np.float64)[i] - offset[k]
+    x0 = np.where(np.isnan(x0), frequency[k, 0], x0)
+    x1 = np.where(np.isnan(x1), frequency[k, -1], x1)
+
+    # one closed rectangle per row, followed by a NaN to break the line
+    nan = np.full_like(x0, np.nan)
+    x = np.stack([x0, x0, x1, x1, x0, nan], axis=1).ravel()
+    y = np.stack([y0, y1, y1, y0, y0, nan], axis=1).ravel()
+    labels = [annotations[j].get('core:label') or annotations[j].get('core:comment') or '' for j in i]
 
-    if time is not None:
-        y0 = time[y0]
-        y1 = time[y1]
+    figure.add_trace(go.Scatter(
+        x=x,
+        y=y,
+        text=np.repeat(labels, 6),
+        hoverinfo='text',
+        fill='toself',
+        mode='lines',
+        name='annotations',
+        showlegend=False,
+    ))
 
-    if 'frequency_lower_edge' in annotation.keys():
-        x0 = annotation['frequency_lower_edge']
-        x1 = annotation['frequency_upper_edge']
-    else:
-        x0 = frequency[0]
-        x1 = frequency[-1]
 
+def draw_spectrogram_detections(figure, detections, annotated):
+    '''Draw detections as markers spanning their bandwidth, the ones that
+    fall within an existing annotation apart from the new ones'''
+    for name, mask, color in (('detection', ~annotated, 'red'), ('annotated detection', annotated, 'white')):
+        d = detections[mask]
+        figure.add_trace(go.Scatter(
+            x=d['freq'],
+            y=d['time'],
+            mode='markers',
+            marker={'color': color, 'size': 4},
+            error_x={'type': 'data', 'array': d['bandwidth'] / 2, 'color': color, 'thickness': 1, 'width': 0},
+            customdata=np.stack([d['bandwidth'], d['dB']], axis=1),
+            hovertemplate='%{x:.4s}Hz, %{customdata[0]:.3s}Hz wide, %{customdata[1]:.1f}dB',
+            name=name,
+            showlegend=False,
+        ))
+
+
+# precision of the spectrogram sent to the browser, 'float32' keeps the exact
+# values, 'uint8' quantizes the dB range of the view to 256 levels, for a
+# payload 4 times smaller, but the hover then shows levels instead of dBs
+spectrogram_precision = 'float32'
+
+
+def quantize(values, levels=256):
+    '''Quantize values to uint8 levels spanning their finite range
+
+    Returns:
+        A tuple with the uint8 array, and the (min, max) range of values
+        mapped to the first and last levels.
+    '''
+    finite = values[np.isfinite(values)]
+    vmin, vmax = (float(finite.min()), float(finite.max())) if finite.size else (0.0, 1.0)
+    scale = (levels - 1) / ((vmax - vmin) or 1)
+
+    q = np.nan_to_num((values - vmin) * scale, nan=0, neginf=0, posinf=levels - 1)
+    return np.round(np.clip(q, 0, levels - 1)).astype(np.uint8), (vmin, vmax)
+
+
+def draw_spectrogram_segments(figure, segments, frequency, sample_rate):
+    '''Draw a line across frequency, the (min, max) range of the view, at
+    each retune of the receiver within the view'''
+    if len(segments) < 2:
+        return
+
+    t = segments['start'][1:] / sample_rate
+    nan = np.full_like(t, np.nan)
     figure.add_trace(go.Scatter(
-        x=[x0, x0, x1, x1, x0],
-        y=[y0, y1, y1, y0, y0],
-        fill='toself',
+        x=np.stack([np.full_like(t, frequency[0]), np.full_like(t, frequency[-1]), nan], axis=1).ravel(),
+        y=np.stack([t, t, nan], axis=1).ravel(),
+        text=np.repeat([f'retuned to {f / 1e6:g}MHz' for f in segments['frequency'][1:]], 3),
+        hoverinfo='text',
         mode='lines',
-        name=annotation['label'],
+        line={'color': 'white', 'dash': 'dash'},
+        name='segments',
         showlegend=False,
     ))
 
 
-def spectrogram(samples, metadata, fc, nperseg, title=None):
-    sample_count = len(samples)
-    sample_rate = metadata['global']['core:sample_rate']
+def spectrogram(pyramid, metadata, start, stop, segments=None, rf_freq=True, title=None, max_rows=1024, progress=None, analyze=False, precision=None):
+    '''Plot the spectrogram of samples [start, stop)
 
-    freq, spectrogram = utils.sigmf_to_spectrogram(samples, sample_rate, nperseg=nperseg, fc=fc)
-    ytime = np.linspace(0.0, float(sample_count / sample_rate), num=sample_count // nperseg)
+    segments are the capture segments of the view, see Capture.segments(),
+    and default to a single one at the frequency of the first capture. Each
+    segment is drawn as its own heatmap, with rows assigned to the segment
+    they start in, at its RF center frequency if rf_freq is set, along with
+    its annotations and detections. precision defaults to
+    spectrogram_precision.
+    '''
+    sample_rate = metadata['global']['core:sample_rate']
+    precision = precision or spectrogram_precision
+    if segments is None:
+        frequency = (metadata.get('captures') or [{}])[0].get('core:frequency', 0)
+        segments = np.array([(start, stop, frequency)], dtype=segment_dtype)
+
+    # baseband, each segment is shifted to its center frequency
+    freq, ytime, spectrogram = pyramid.get(start, stop, sample_rate, max_rows=max_rows, progress=progress)
+    fcs = segments['frequency'] if rf_freq else np.zeros(len(segments))
+
+    # first row of each segment, and the end of the last one
+    row_starts = np.round(ytime * sample_rate)
+    bounds = np.append(np.searchsorted(row_starts, segments['start']), len(ytime))
+    bounds[0] = 0
+
+    # large arrays are sent as base64 typed arrays, and both axes are
+    # regular so they are sent as an origin and a step only
+    if precision == 'uint8':
+        z, (zmin, zmax) = quantize(spectrogram)
+        ticks = np.linspace(0, 255, 6)
+        colorbar = {
+            'tickvals': ticks,
+            'ticktext': [f'{zmin + t * (zmax - zmin) / 255:.1f}dB' for t in ticks],
+        }
+        hover_z = 'level %{z}'
+    else:
+        z = spectrogram.astype(np.float32)
+        colorbar = {
+            'exponentformat': 'SI',
+            'ticksuffix': 'dB',
+        }
+        hover_z = '%{z:.1f}dB'
+
+    fig = go.Figure()
+    for fc, r0, r1 in zip(fcs, bounds[:-1], bounds[1:]):
+        if r1 <= r0 and len(ytime):
+            continue
+
+        fig.add_trace(go.Heatmap(
+            z=z[r0:r1],
+            x0=freq[0] + fc,
+            dx=freq[1] - freq[0],
+            y0=ytime[r0] if r0 < len(ytime) else 0,
+            dy=ytime[1] - ytime[0] if len(ytime) > 1 else 1,
+            coloraxis='coloraxis',
+            hovertemplate='Frequency: %{x}<br>Time: %{y}<br>PSD: ' + hover_z + '<extra></extra>',
+        ))
 
-    fig = px.imshow(
-        spectrogram,
-        x=freq,
-        y=ytime,
-        title=title,
-        aspect='auto',
-        labels={
-            'x': 'Frequency',
-            'y': 'Time',
-            'color': 'PSD',
-        },
-    )
     fig.update_layout(
+        title=title,
         hovermode='x unified',
+        xaxis_title='Frequency',
         xaxis_exponentformat='SI',
         xaxis_ticksuffix='Hz',
+        yaxis_title='Time',
         yaxis_exponentformat='SI',
         yaxis_ticksuffix='s',
+        # time going down, like px.imshow()
+        yaxis_autorange='reversed',
         coloraxis={
             'colorscale': 'viridis',
+            'colorbar': colorbar,
         },
     )
 
-    fig.update_coloraxes(
-        colorbar_exponentformat='SI',
-        colorbar_ticksuffix='dB',
+    draw_spectrogram_segments(fig, segments, (freq[0] + fcs.min(), freq[-1] + fcs.max()), sample_rate)
+
+    # annotation edges are RF frequencies
+    offsets = segments['frequency'] - fcs
+    draw_spectrogram_annotations(
+        fig, metadata['annotations'], freq + fcs[:, None], sample_rate,
+        segments['start'], segments['stop'], offset=offsets,
     )
 
-    for a in metadata['annotations']:
-        draw_spectrogram_annotation(fig, a, frequency=freq, time=ytime)
+    if analyze:
+        with metrics.timer('detect'):
+            detections = utils.detect_bursts(freq, ytime, spectrogram)
+
+        # segment of the row of each detection
+        k = np.searchsorted(segments['start'], np.round(detections['time'] * sample_rate), side='right') - 1
+        k = np.clip(k, 0, len(segments) - 1)
+        detections['freq'] += fcs[k]
+        rf = detections.copy()
+        rf['freq'] += offsets[k]
+        draw_spectrogram_detections(fig, detections, utils.annotated(rf, metadata['annotations'], sample_rate))
 
     return fig
 
@@ -186,24 +406,42 @@ def draw_frequency_bandwidths(figure, peaks):
 
 
 def frequencies(samples, metadata, fc, nperseg, title=None, analyze=False):
-    sample_rate = metadata['global']['core:sample_rate']
-    f, psd = utils.samples_to_psd(samples, sample_rate, fc=fc, nperseg=nperseg)
-    fig = px.line(
-        x=f,
-        y=psd,
-        title=title,
-        labels={
-            'x': 'Frequency',
-            'y': 'PSD',
-        },
-    )
+    return segment_frequencies([(samples, fc, 'PSD')], metadata, nperseg, title=title, analyze=analyze)
 
-    if analyze:
-        peaks = utils.get_peaks(f, psd, prominence=5)
-        draw_frequency_peaks(fig, peaks)
-        draw_frequency_bandwidths(fig, peaks)
+
+def segment_frequencies(segments, metadata, nperseg, title=None, analyze=False):
+    '''Plot the PSD of capture segments, one trace per segment
+
+    Args:
+        segments:
+            list of (samples, fc, name) tuples, samples being read one chunk
+            at a time
+    '''
+    sample_rate = metadata['global']['core:sample_rate']
+    fig = go.Figure()
+
+    for samples, fc, name in segments:
+        with metrics.timer('psd'):
+            f, psd = utils.samples_to_psd(samples, sample_rate, fc=fc, nperseg=nperseg)
+
+        fig.add_trace(go.Scatter(
+            x0=f[0],
+            dx=f[1] - f[0] if len(f) > 1 else 1,
+            y=psd.astype(np.float32),
+            mode='lines',
+            name=name,
+        ))
+
+        if analyze:
+            with metrics.timer('peaks'):
+                peaks = utils.get_peaks(f, psd, prominence=5)
+            draw_frequency_peaks(fig, peaks)
+            draw_frequency_bandwidths(fig, peaks)
 
     fig.update_layout(
+        title=title,
+        xaxis_title='Frequency',
+        yaxis_title='PSD',
         hovermode='x unified',
         xaxis_exponentformat='SI',
         xaxis_ticksuffix='Hz',
@@ -1,10 +1,16 @@
+import contextlib
+import functools
+import time
+
 import plotly.graph_objs as go
 
-from dash import callback, dcc, html, Input, Output, State
+from dash import callback, ctx, dcc, html, no_update, Input, Output, State, ALL
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 
-from pyq_engine import utils
+from pyq_engine import cache, metrics
 from pyq_engine.components import plot
+from pyq_engine.pyramid import SpectrogramPyramid
 
 
 def tabs(default='spectrogram'):
@@ -20,9 +26,20 @@ def tabs(default='spectrogram'):
             id='tabs',
             active_tab=default,
         ),
+        # progress of the figure being computed in the background
+        dbc.Progress(
+            id='graph-progress',
+            value=0,
+            style={
+                'margin-top': '5px',
+                'visibility': 'hidden',
+            },
+        ),
         dbc.Spinner(
             [
-                dcc.Store(id='graph-store'),
+                dcc.Store(id='zoom-store'),
+                # figure to compute in the background, not memoized yet
+                dcc.Store(id='figure-request'),
                 html.Div(id="tab-content"),
             ],
             color='primary',
@@ -31,56 +48,288 @@ def tabs(default='spectrogram'):
 )
 
 
+# seconds a request waits for a newer one before being computed
+debounce = 0.1
+# milliseconds between polls of a background job, Dash defaults to 1s
+poll_interval = 100
+
+
+def graphs(fig):
+    return (
+        dcc.Graph(
+            id={'type': 'pyq-engine-graph', 'id': 'tab'},
+            figure=fig,
+            style={'width': '80vw', 'height': '80vh'},
+        ),
+        dcc.Graph(
+            id={'type': 'pyq-engine-graph', 'id': 'fullscreen'},
+            figure=fig,
+            style={'width': '100vw', 'height': '100vh'},
+        ),
+    )
+
+
 @callback(
     Output("tab-content", "children"),
     Output("modal-fs", "children"),
-    [Input("tabs", "active_tab"), Input('graph-store', 'data')],
+    Output('figure-request', 'data'),
+    [
+        Input("tabs", "active_tab"),
+        Input('samples-store', 'data'),
+        Input('fft-size', 'value'),
+        Input('fft-overlap', 'value'),
+        Input(dict(type='pyq-engine-onoff-button', id='rf-freq'), 'n_clicks'),
+        Input(dict(type='pyq-engine-onoff-button', id='do-analysis'), 'n_clicks'),
+        Input('cursor', 'value'),
+        Input('zoom-store', 'data'),
+        Input('channel', 'value'),
+    ],
+    State('session-id', 'data'),
 )
-def render_tab_content(active_tab, data):
+def render_tab_content(active_tab, store, nperseg, overlap, rf_freq, analyze, cursor, zoom, channel=0, session=None):
     """
     This callback takes the 'active_tab' property as input, as well as the
-    stored graphs, and renders the tab content depending on what the value of
-    'active_tab' is.
+    view controls, and renders the figure of the active tab only.
+
+    Memoized figures are returned right away, so that switching back to a
+    view costs a single request. Other figures are handed to
+    compute_tab_content(), in a background job.
+    """
+    # supersedes the previous requests of the session, even if memoized
+    generation = cache.new_request(session) if session else None
+
+    if not active_tab:
+        return "No tab selected", "No tab selected", no_update
+
+    if not store:
+        # empty graph when app loads
+        return *graphs(go.Figure(data=[])), no_update
+
+    params = dict(
+        view=active_tab, key=store['key'], title=store['filename'], cursor=cursor,
+        zoom=zoom,
+        nperseg=nperseg,
+        noverlap=nperseg * (overlap or 0) // 100,
+        rf_freq=bool(rf_freq % 2),
+        analyze=bool(analyze % 2),
+        channel=channel or 0,
+    )
+
+    fig = memoized_figure(**params)
+    if fig is not None:
+        return *graphs(fig), no_update
+
+    return no_update, no_update, {'session': session, 'generation': generation, 'figure': params}
+
+
+@callback(
+    Output("tab-content", "children", allow_duplicate=True),
+    Output("modal-fs", "children", allow_duplicate=True),
+    Input('figure-request', 'data'),
+    background=True,
+    interval=poll_interval,
+    progress=[
+        Output('graph-progress', 'value'),
+        Output('graph-progress', 'label'),
+    ],
+    running=[
+        (Output('graph-progress', 'style'), {'margin-top': '5px'}, {'margin-top': '5px', 'visibility': 'hidden'}),
+    ],
+    prevent_initial_call=True,
+)
+def compute_tab_content(set_progress, request):
     """
-    if active_tab and data is not None:
-        if active_tab in data.keys():
-            return (
-                dcc.Graph(figure=data[active_tab], style={'width': '80vw', 'height': '80vh'}),
-                dcc.Graph(figure=data[active_tab], style={'width': '100vw', 'height': '100vh'}),
-            )
+    Compute a figure that isn't memoized yet, in a background job.
 
-    return "No tab selected", "No tab selected"
+    Dash cancels the job when the callback fires again, so stale figures are
+    never finished. Requests of a session are also coalesced on the server:
+    a request waits for `debounce` seconds, and gives up as soon as a newer
+    one comes in, memoized or not.
+    """
+    session = request['session']
+    latest = cache.latest_request(session, request['generation']) if session else lambda: True
+
+    def progress(done, total):
+        if not latest():
+            raise PreventUpdate
+        set_progress((100 * done // total, f'{done}/{total}'))
+
+    time.sleep(debounce if session else 0)
+    if not latest():
+        raise PreventUpdate
+
+    set_progress((0, ''))
+    fig = figure(**request['figure'], progress=progress)
+    if not latest():
+        raise PreventUpdate
+
+    return graphs(fig)
+
+
+# axis holding time in the views that can be zoomed
+time_axis = {
+    'spectrogram': 'yaxis',
+    'time': 'xaxis',
+}
 
 
 @callback(
-        Output('graph-store', 'data'),
+    Output('zoom-store', 'data'),
     [
-        Input('filename', 'filename'),
-        Input('samples-store', 'data'),
-        Input('metadata-store', 'data'),
-        Input('fft-size', 'value'),
-        Input(dict(type='pyq-engine-onoff-button', id='rf-freq'), 'n_clicks'),
-        Input(dict(type='pyq-engine-onoff-button', id='do-analysis'), 'n_clicks'),
+        Input({'type': 'pyq-engine-graph', 'id': ALL}, 'relayoutData'),
         Input('cursor', 'value'),
     ],
+    [
+        State('tabs', 'active_tab'),
+        State('metadata-store', 'data'),
+        State('zoom-store', 'data'),
+    ],
+    prevent_initial_call=True,
 )
-def generate_graphs(filename, store, metadata, nperseg, rf_freq, analyze, cursor):
+def update_zoom(relayout, cursor, active_tab, metadata, zoom):
     """
-    This callback generates three simple graphs from random data.
+    Convert the time axis range of the spectrogram or time views to a sample
+    range, so that the view can be recomputed at the resolution matching the
+    zoom level. Any change to the sample slice resets the zoom.
     """
-    if not store:
-        # generate empty graphs when app loads
-        return {k: go.Figure(data=[]) for k in ['spectrogram', 'frequency', 'time', 'iq']}
+    if ctx.triggered_id == 'cursor' or metadata is None:
+        if zoom is None:
+            raise PreventUpdate
+        return None
+
+    axis = time_axis.get(active_tab)
+    if axis is None:
+        raise PreventUpdate
+
+    relayout = ctx.triggered[0]['value'] or {}
+    if relayout.get(f'{axis}.autorange'):
+        return None
+
+    if f'{axis}.range[0]' not in relayout:
+        raise PreventUpdate
+
+    sample_rate = metadata['global']['core:sample_rate']
+    start, stop = sorted([relayout[f'{axis}.range[0]'], relayout[f'{axis}.range[1]']])
+    start = max(cursor[0], int(start * sample_rate))
+    stop = min(cursor[1], int(stop * sample_rate))
+
+    return [start, stop] if start < stop else None
+
+
+def memoize(**kwargs):
+    '''Memoize a figure in cache.figures, under a name including the cache
+    version, the cache is only opened when a figure is first looked up'''
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}:{cache.version}'
+        memoized = functools.cache(lambda: cache.figures.memoize(name=name, **kwargs)(func))
+
+        @functools.wraps(func)
+        def wrapper(*args, **func_kwargs):
+            return memoized()(*args, **func_kwargs)
+
+        wrapper.__cache_key__ = lambda *args: memoized().__cache_key__(*args)
+        return wrapper
+    return decorator
+
+
+def figure_function(view, key, title, cursor, zoom, nperseg, noverlap, rf_freq, analyze, channel=0):
+    """
+    Return the memoized function computing the figure of a view, and its
+    arguments, only passing down the parameters it depends on, so that
+    changing an unrelated control hits the memoized figure.
+
+    The plot options are part of the arguments, and so is the version of
+    the capture, see cache.capture_key(), for captures rewritten on the
+    server not to show stale figures.
+    """
+    key = cache.capture_key(key)
+    # from the browser, as lists
+    cursor, zoom = tuple(cursor), tuple(zoom) if zoom else None
+
+    if view == 'spectrogram':
+        return spectrogram_figure, (key, title, zoom or cursor, nperseg, noverlap, channel, rf_freq, analyze, plot.spectrogram_precision)
+    elif view == 'frequency':
+        return frequency_figure, (key, title, cursor, nperseg, channel, rf_freq, analyze)
+    elif view == 'time':
+        return time_figure, (key, title, zoom or cursor, channel, plot.time_max_points)
+    elif view == 'iq':
+        return iq_figure, (key, title, cursor, channel, plot.iq_bins)
+
+    raise ValueError(f'unknown view: {view}')
+
+
+def memoized_figure(view, key, title, cursor, zoom, nperseg, noverlap, rf_freq, analyze, channel=0):
+    """
+    Return the figure of a view if it is memoized, None otherwise, see
+    figure_function() for the parameters.
+    """
+    func, args = figure_function(view, key, title, cursor, zoom, nperseg, noverlap, rf_freq, analyze, channel)
+    fig = cache.figures.get(func.__cache_key__(*args))
+    if fig is not None:
+        metrics.cache_lookup('figures', True)
+    return fig
+
+
+def figure(view, key, title, cursor, zoom, nperseg, noverlap, rf_freq, analyze, channel=0, progress=None):
+    """
+    Return the figure of a view, computing it if it isn't memoized, see
+    figure_function() for the parameters.
+
+    Figures are memoized in cache.figures, on disk, so they are shared by
+    the background processes. progress(done, total) is called by the views
+    able to report it.
+    """
+    func, args = figure_function(view, key, title, cursor, zoom, nperseg, noverlap, rf_freq, analyze, channel)
+    key = args[0]
+
+    metrics.cache_lookup('samples', key in cache.samples)
+    capture = cache.get_capture(key)
+    if capture is None:
+        # spooled capture was removed from the server
+        return go.Figure(data=[], layout_title='Samples expired, please reload the file')
+
+    kwargs = {'progress': progress} if view == 'spectrogram' else {}
+    hit = func.__cache_key__(*args) in cache.figures
+    metrics.cache_lookup('figures', hit)
+    with contextlib.nullcontext() if hit else metrics.timer(f'figure.{view}'):
+        return func(*args, **kwargs)
+
+
+@memoize(ignore={'progress'})
+def spectrogram_figure(key, title, sample_range, nperseg, noverlap, channel, rf_freq, analyze, precision, progress=None):
+    capture = cache.get_capture(key).channel(channel)
+    pyramid = SpectrogramPyramid(capture, f'{key}:{channel}', nperseg, noverlap=noverlap)
+    start, stop = sample_range
+
+    return plot.spectrogram(
+        pyramid, capture.metadata, start, stop,
+        segments=capture.segments(start, stop), rf_freq=rf_freq,
+        title=title, progress=progress, analyze=analyze, precision=precision,
+    )
+
+
+@memoize()
+def frequency_figure(key, title, cursor, nperseg, channel, rf_freq, analyze):
+    capture = cache.get_capture(key).channel(channel)
+
+    # one PSD per capture segment overlapping the slice, each with its own
+    # center frequency, the other segments are never read
+    segments = [
+        (capture.slice(start, stop), frequency if rf_freq else 0, f'{frequency / 1e6:g}MHz')
+        for start, stop, frequency in capture.segments(*cursor)
+        if stop > start
+    ]
+    return plot.segment_frequencies(segments, capture.metadata, nperseg=nperseg, title=title, analyze=analyze)
 
-    samples = utils.deserialize_samples(store)
-    samples = samples[cursor[0]:cursor[1]]
 
-    fc = metadata['captures'][0]['core:frequency'] if rf_freq % 2 else 0
+@memoize()
+def time_figure(key, title, sample_range, channel, max_points):
+    capture = cache.get_capture(key).channel(channel)
+    start, stop = sample_range
+    return plot.time(capture.slice(start, stop), capture.metadata, title=title, offset=start, max_points=max_points)
 
-    graphs = {}
-    graphs['spectrogram'] = plot.spectrogram(samples, metadata, fc=fc, nperseg=nperseg, title=filename)
-    graphs['frequency'] = plot.frequencies(samples, metadata, fc=fc, nperseg=nperseg, title=filename, analyze=analyze % 2)
-    graphs['time'] = plot.time(samples, metadata, title=filename)
-    graphs['iq'] = plot.IQ(samples, title=filename)
 
-    return graphs
+@memoize()
+def iq_figure(key, title, cursor, channel, bins):
+    capture = cache.get_capture(key).channel(channel)
+    return plot.IQ(capture.slice(cursor[0], cursor[1]), title=title, bins=bins)
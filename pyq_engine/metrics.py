@@ -0,0 +1,160 @@
+import contextlib
+import time
+
+import flask
+
+from pyq_engine import cache
+
+blueprint = flask.Blueprint('metrics', __name__)
+
+# counters are kept on disk, to add up the measurements of every worker and
+# background process
+store = cache.DiskCache('metrics')
+
+# upper bounds of the duration histogram buckets, in seconds
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+# name: (type, label, help)
+definitions = {
+    'pyq_engine_callback_seconds': ('histogram', 'callback', 'Wall time of Dash callback requests'),
+    'pyq_engine_stage_seconds': ('histogram', 'stage', 'Wall time of processing stages'),
+    'pyq_engine_callback_request_bytes_total': ('counter', 'callback', 'Bytes received by Dash callback requests'),
+    'pyq_engine_callback_response_bytes_total': ('counter', 'callback', 'Bytes sent by Dash callback responses, including background job results'),
+    'pyq_engine_cache_hits_total': ('counter', 'cache', 'Cache lookups returning a value'),
+    'pyq_engine_cache_misses_total': ('counter', 'cache', 'Cache lookups that had to compute the value'),
+}
+
+# sums are stored as integers, in micro-units
+scale = 10**6
+
+
+def inc(name, label, value=1):
+    store.incr((name, label), value)
+
+
+def observe(name, label, seconds):
+    '''Record a duration in a histogram
+
+    Only the smallest bucket the duration fits in is counted, buckets are
+    made cumulative when collected.
+    '''
+    le = next(le for le in buckets if seconds <= le)
+    with store.transact():
+        store.incr((name, label, le))
+        store.incr((name, label, 'sum'), round(seconds * scale))
+        store.incr((name, label, 'count'))
+
+
+@contextlib.contextmanager
+def timer(stage):
+    '''Time the wrapped block as a processing stage'''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('pyq_engine_stage_seconds', stage, time.perf_counter() - start)
+
+
+def cache_lookup(name, hit):
+    inc('pyq_engine_cache_hits_total' if hit else 'pyq_engine_cache_misses_total', name)
+
+
+def collect():
+    '''Return the recorded metrics
+
+    Returns:
+        A dict of metric name to a dict of label value to the counter value,
+        or to a dict with the buckets, sum and count of the histogram.
+    '''
+    metrics = {name: {} for name in definitions}
+    for key in store:
+        name, label, *field = key
+        if name not in definitions:
+            # from another version
+            continue
+
+        value = store.get(key, 0)
+        if definitions[name][0] == 'counter':
+            metrics[name][label] = value
+            continue
+
+        h = metrics[name].setdefault(label, {'buckets': {le: 0 for le in buckets}, 'sum': 0.0, 'count': 0})
+        if field[0] == 'sum':
+            h['sum'] = value / scale
+        elif field[0] == 'count':
+            h['count'] = value
+        else:
+            h['buckets'][field[0]] = value
+
+    for name, values in metrics.items():
+        if definitions[name][0] == 'histogram':
+            for h in values.values():
+                total = 0
+                for le in buckets:
+                    total += h['buckets'][le]
+                    h['buckets'][le] = total
+
+    return metrics
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus():
+    '''Return the recorded metrics in the Prometheus text format'''
+    lines = []
+    for name, values in collect().items():
+        kind, label, help_ = definitions[name]
+        lines.append(f'# HELP {name} {help_}')
+        lines.append(f'# TYPE {name} {kind}')
+
+        for value, m in sorted(values.items()):
+            labels = f'{label}="{escape(value)}"'
+            if kind == 'counter':
+                lines.append(f'{name}{{{labels}}} {m}')
+                continue
+
+            for le, count in m['buckets'].items():
+                le = '+Inf' if le == float('inf') else le
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'{name}_sum{{{labels}}} {m["sum"]}')
+            lines.append(f'{name}_count{{{labels}}} {m["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+@blueprint.route('/metrics')
+def endpoint():
+    return flask.Response(prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def callback_name(request):
+    '''Return the outputs of the Dash callback a request is for, or None'''
+    if request.path != '/_dash-update-component':
+        return None
+
+    body = request.get_json(silent=True) or {}
+    return body.get('output')
+
+
+@blueprint.before_app_request
+def start_timer():
+    flask.g.metrics_start = time.perf_counter()
+
+
+@blueprint.after_app_request
+def record_request(response):
+    name = callback_name(flask.request)
+    if name is None:
+        return response
+
+    inc('pyq_engine_callback_request_bytes_total', name, flask.request.content_length or 0)
+    inc('pyq_engine_callback_response_bytes_total', name, response.calculate_content_length() or 0)
+
+    # background callbacks are polled for their result, only time the
+    # request starting the job, the job itself is timed by stages
+    if 'job' not in flask.request.args:
+        observe('pyq_engine_callback_seconds', name, time.perf_counter() - flask.g.metrics_start)
+
+    return response
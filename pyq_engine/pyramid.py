@@ -0,0 +1,125 @@
+import numpy as np
+
+from pyq_engine import cache, metrics, utils
+
+
+class SpectrogramPyramid:
+    '''Multi-resolution spectrogram of a capture, computed lazily by tiles
+
+    Level 0 holds one row per FFT, each level above it halves the time
+    resolution by pooling pairs of rows of the level below. Levels are split
+    in tiles of tile_rows rows, computed on demand and kept in cache.tiles,
+    so only the part of the capture being looked at is ever processed.
+
+    Args:
+        capture:
+            Capture, or any sliceable sample source
+        key:
+            unique key of the capture, used for caching tiles
+        nperseg:
+            FFT size
+        noverlap:
+            number of samples shared by consecutive level 0 rows
+        window:
+            window passed to signal.get_window()
+        pooling:
+            'max' to keep short bursts visible, or 'mean' to average power
+        tile_rows:
+            number of rows in a tile
+    '''
+
+    def __init__(self, capture, key, nperseg, noverlap=0, window='hann', pooling='max', tile_rows=256):
+        if pooling not in ('max', 'mean'):
+            raise ValueError(f'unsupported pooling: {pooling}')
+
+        self.capture = capture
+        self.key = key
+        self.nperseg = nperseg
+        self.noverlap = noverlap
+        self.window = window
+        self.pooling = pooling
+        self.tile_rows = tile_rows
+
+        self.step = nperseg - noverlap
+        self.rows = max(0, (len(capture) - nperseg) // self.step + 1)
+
+    def level_rows(self, level):
+        return -(-self.rows // 2**level)
+
+    def tile(self, level, index):
+        '''Return a tile, computing it if needed'''
+        key = (cache.version, self.key, self.nperseg, self.noverlap, self.window, self.pooling, self.tile_rows, level, index)
+
+        tile = cache.tiles.get(key)
+        metrics.cache_lookup('tiles', tile is not None)
+        if tile is None:
+            tile = self._compute(level, index)
+            cache.tiles.set(key, tile)
+
+        return tile
+
+    def _compute(self, level, index):
+        if level == 0:
+            r0 = index * self.tile_rows
+            r1 = min(r0 + self.tile_rows, self.rows)
+            with metrics.timer('tile'):
+                samples = self.capture[r0 * self.step:(r1 - 1) * self.step + self.nperseg]
+                _, rows = utils.sigmf_to_spectrogram(samples, 1, nperseg=self.nperseg, noverlap=self.noverlap, window=self.window)
+                return rows.astype(np.float32)
+
+        rows = self.tile(level - 1, 2 * index)
+        if (2 * index + 1) * self.tile_rows < self.level_rows(level - 1):
+            rows = np.concatenate([rows, self.tile(level - 1, 2 * index + 1)])
+
+        return self._pool(rows)
+
+    def _pool(self, rows):
+        if len(rows) % 2:
+            rows = np.concatenate([rows, rows[-1:]])
+
+        if self.pooling == 'max':
+            return np.maximum(rows[0::2], rows[1::2])
+
+        # average power, not dBs
+        power = 10 ** (rows / 10)
+        return (10 * np.log10((power[0::2] + power[1::2]) / 2)).astype(np.float32)
+
+    def get(self, start, stop, sample_rate, fc=0, max_rows=1024, progress=None):
+        '''Return the spectrogram of samples [start, stop)
+
+        The finest level with at most max_rows rows over the range is used.
+        If set, progress(done, total) is called as tiles are computed.
+
+        Returns:
+            A tuple with the frequency axis, the time of each row in seconds
+            from the start of the capture, and a (rows, nperseg) array in dB.
+        '''
+        f = np.linspace(fc - sample_rate / 2, fc + sample_rate / 2, self.nperseg)
+
+        r0 = max(0, start // self.step)
+        r1 = min(self.rows, (stop - self.nperseg) // self.step + 1)
+        if r1 <= r0:
+            return f, np.empty(0), np.empty((0, self.nperseg), dtype=np.float32)
+
+        level = 0
+        while True:
+            l0 = r0 // 2**level
+            l1 = -(-r1 // 2**level)
+            if l1 - l0 <= max_rows:
+                break
+            level += 1
+
+        t0 = l0 // self.tile_rows
+        t1 = (l1 - 1) // self.tile_rows
+
+        tiles = []
+        for i in range(t0, t1 + 1):
+            tiles.append(self.tile(level, i))
+            if progress is not None:
+                progress(i - t0 + 1, t1 - t0 + 1)
+
+        tiles = np.concatenate(tiles)
+        spectrogram = tiles[l0 - t0 * self.tile_rows:l1 - t0 * self.tile_rows]
+        t = np.arange(l0, l1) * 2**level * self.step / sample_rate
+
+        return f, t, spectrogram
@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import logging
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from pyq_engine import cache, utils
+from pyq_engine.capture import Capture
+from pyq_engine.tools.catalog import stat_key
+
+logger = logging.getLogger(__name__)
+
+
+def find_captures(directory):
+    '''Return the .sigmf archives and .sigmf-meta files under directory'''
+    directory = Path(directory)
+    return sorted([*directory.glob('**/*.sigmf'), *directory.glob('**/*.sigmf-meta')])
+
+
+def stat_capture(path):
+    '''Return the latest mtime and the total size of the files of a capture
+
+    Both the .sigmf-meta and .sigmf-data files of a pair are looked at, so
+    rewriting either one has the capture analyzed again.
+    '''
+    path = Path(path)
+    files = [path] if path.suffix == '.sigmf' else [path.with_suffix('.sigmf-meta'), path.with_suffix('.sigmf-data')]
+    stats = [stat_key(f) for f in files if f.exists()]
+    return max(mtime for mtime, _ in stats), sum(size for _, size in stats)
+
+
+def analyze_file(path, nperseg=1024, prominence=5, chunk_size=2**22):
+    '''Compute the PSD, peaks and summary statistics of a capture, to be run
+    in a worker process
+
+    Samples are read chunk by chunk, so captures of any size are processed
+    in bounded memory. Only the first capture segment, and the first channel,
+    of a recording are analyzed.
+
+    Returns:
+        A tuple with the path, the summary dict, the (2, nperseg) frequency
+        axis and PSD, the peaks DataFrame, and an error message if the
+        capture couldn't be analyzed.
+    '''
+    try:
+        capture = Capture.open(path)
+        segments = len(capture.segment_index)
+
+        # the PSD of a retuned recording only makes sense per segment
+        start, stop, fc = capture.segments()[0]
+        capture = capture.slice(start, stop)
+        if len(capture) < nperseg:
+            raise ValueError(f'capture shorter than the FFT size ({len(capture)} samples)')
+
+        acc = utils.WelchAccumulator(capture.sample_rate, fc=fc, nperseg=nperseg)
+        energy = 0.0
+        peak = 0.0
+        for start in range(0, len(capture), chunk_size):
+            chunk = capture[start:start + chunk_size]
+            acc.update(chunk)
+            power = chunk.real**2 + chunk.imag**2
+            energy += power.sum(dtype=np.float64)
+            peak = max(peak, power.max())
+
+        f, psd = acc.result()
+        peaks = utils.get_peaks(f, psd, prominence=prominence)
+    except Exception as e:
+        return path, None, None, None, str(e)
+
+    mtime, size = stat_capture(path)
+    summary = {
+        'filename': Path(path).as_posix(),
+        'mtime': mtime,
+        'size': size,
+        'datatype': capture.datatype,
+        'sample_rate': capture.sample_rate,
+        'frequency': fc,
+        'segments': segments,
+        'channels': capture.num_channels,
+        'samples': len(capture),
+        'duration': len(capture) / capture.sample_rate,
+        'power': 10 * np.log10(energy / len(capture)),
+        'peak_power': 10 * np.log10(peak),
+        'noise_floor': np.median(psd),
+        'peaks': len(peaks),
+    }
+
+    peaks = peaks[['center freq', 'bandwidth', 'dBs', 'prominences']].assign(filename=summary['filename'])
+
+    return path, summary, np.stack((f, psd)), peaks, None
+
+
+class Results:
+    '''Analysis results, written incrementally to a directory
+
+    Each chunk of analyzed captures is written as a set of parts: the
+    summaries and peaks as Parquet files, and the PSDs as an NPZ file. The
+    summary part is written last, so a part is only considered done once it
+    exists, and an interrupted run resumes from the last complete part.
+
+    Args:
+        path:
+            output directory, created if needed
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def parts(self):
+        return sorted(int(p.stem.removeprefix('summary-')) for p in self.path.glob('summary-*.parquet'))
+
+    def summary(self):
+        '''Return the summaries of all the parts, one row per capture
+
+        Captures analyzed again after being modified keep their latest
+        results only.
+        '''
+        parts = [pd.read_parquet(self.path / f'summary-{i:05d}.parquet') for i in self.parts()]
+        if not parts:
+            return pd.DataFrame()
+
+        df = pd.concat(parts, ignore_index=True)
+        return df.drop_duplicates('filename', keep='last').reset_index(drop=True)
+
+    def peaks(self):
+        '''Return the peaks of all the parts, one row per peak
+
+        Like summary(), captures analyzed again only keep the peaks of their
+        latest results.
+        '''
+        latest = {}
+        for i in self.parts():
+            summary = pd.read_parquet(self.path / f'summary-{i:05d}.parquet', columns=['filename'])
+            latest.update(dict.fromkeys(summary['filename'], i))
+
+        parts = []
+        for i in self.parts():
+            peaks = pd.read_parquet(self.path / f'peaks-{i:05d}.parquet')
+            if not peaks.empty:
+                parts.append(peaks[peaks['filename'].map(latest) == i])
+
+        return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+    def psds(self):
+        '''Return the PSDs of all the parts, as a dict of (2, nperseg) arrays
+        indexed by filename'''
+        psds = {}
+        for i in self.parts():
+            with np.load(self.path / f'psd-{i:05d}.npz') as npz:
+                psds.update(zip(npz['filenames'], npz['psds']))
+        return psds
+
+    def done(self):
+        '''Return the set of (filename, mtime, size) already analyzed'''
+        df = self.summary()
+        if df.empty:
+            return set()
+        return set(zip(df['filename'], df['mtime'], df['size']))
+
+    def write(self, summaries, psds, peaks):
+        '''Write a new part'''
+        index = max(self.parts(), default=-1) + 1
+
+        if psds:
+            filenames = [s['filename'] for s in summaries]
+            np.savez(self.path / f'psd-{index:05d}.npz', filenames=filenames, psds=np.stack(psds))
+
+        peaks = pd.concat(peaks, ignore_index=True) if peaks else pd.DataFrame()
+        peaks.to_parquet(self.path / f'peaks-{index:05d}.parquet')
+
+        # written last, marks the part as complete
+        tmp = self.path / f'summary-{index:05d}.tmp'
+        pd.DataFrame(summaries).to_parquet(tmp)
+        tmp.rename(self.path / f'summary-{index:05d}.parquet')
+
+
+def analyze(directory, output, jobs=1, nperseg=1024, chunksize=256):
+    '''Analyze the captures of directory not yet in the output directory
+
+    Captures are analyzed by a pool of jobs processes, and results written
+    every chunksize captures.
+
+    Yields:
+        A dict with the number of captures to analyze, the number analyzed
+        so far, and the captures that couldn't be analyzed.
+    '''
+    results = Results(output)
+    done = results.done()
+
+    paths = [p.as_posix() for p in find_captures(directory)]
+    paths = [p for p in paths if (p, *stat_capture(p)) not in done]
+
+    progress = {'total': len(paths), 'analyzed': 0, 'errors': {}}
+    if not paths:
+        yield progress
+        return
+
+    with ProcessPoolExecutor(jobs) if jobs > 1 else nullcontext() as pool:
+        map_ = pool.map if pool is not None else map
+        kwargs = {'chunksize': max(1, chunksize // jobs)} if pool is not None else {}
+
+        summaries, psds, peaks = [], [], []
+        for path, summary, psd, p, error in map_(partial(analyze_file, nperseg=nperseg), paths, **kwargs):
+            progress['analyzed'] += 1
+
+            if error is not None:
+                logger.warning(f'skipping {path}: {error}')
+                progress['errors'][path] = error
+            else:
+                summaries.append(summary)
+                psds.append(psd)
+                peaks.append(p)
+
+            if progress['analyzed'] % chunksize == 0 or progress['analyzed'] == progress['total']:
+                if summaries:
+                    results.write(summaries, psds, peaks)
+                    summaries, psds, peaks = [], [], []
+                yield dict(progress)
+
+
+def default_output(directory):
+    '''Return the results directory of a captures directory, in the user
+    state directory, so captures can be analyzed from read-only storage'''
+    directory = Path(directory).resolve()
+    digest = hashlib.sha1(directory.as_posix().encode()).hexdigest()[:12]
+    return cache.user_dir('state') / 'analysis' / f'{directory.name}-{digest}'
+
+
+def main():
+    parser = argparse.ArgumentParser('pyq-analyze')
+    parser.add_argument('dir', type=Path)
+    parser.add_argument('--output', '-o', type=Path, help='results directory, defaults to one per input directory in the user state directory')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes analyzing captures')
+    parser.add_argument('--fft-size', type=int, default=1024)
+    parser.add_argument('--chunksize', type=int, default=256, help='number of captures per results part')
+    options = parser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+
+    if not options.dir.exists():
+        logger.critical('input directory doesn\'t exist')
+        return
+
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        sys.exit('writing results requires pyarrow, install pyq-engine with the analyze extra')
+
+    output = options.output or default_output(options.dir)
+    for progress in analyze(options.dir, output, jobs=options.jobs, nperseg=options.fft_size, chunksize=options.chunksize):
+        print(f"analyzed {progress['analyzed']}/{progress['total']} captures, {len(progress['errors'])} errors")
+
+    print(f'results in: {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import json
+import logging
+import sqlite3
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# version of the records of flatten_sigmf(), bump it when they change so
+# that existing catalogs are indexed again
+version = 1
+
+
+def flatten_sigmf(filename):
+    '''Read a .sigmf-meta file, without opening the data file
+
+    Returns:
+        A dict with the metadata, the first capture stored as 'captures.0',
+        along with the number of capture segments and the range of their
+        center frequencies.
+    '''
+    with open(filename) as f:
+        m = json.load(f)
+
+    captures = sorted(m['captures'], key=lambda c: c.get('core:sample_start', 0))
+    frequencies = [c['core:frequency'] for c in captures if 'core:frequency' in c]
+
+    m['filename'] = Path(filename).as_posix()
+    m['captures.0'] = captures[0]
+    m['segments'] = len(captures)
+    if frequencies:
+        m['frequency'] = {'min': min(frequencies), 'max': max(frequencies)}
+    del(m['captures'])
+
+    return m
+
+
+def stat_tree(directory, recursive=True):
+    '''Return the path, mtime and size of the .sigmf-meta files in directory'''
+    files = Path(directory).glob('**/*.sigmf-meta' if recursive else '*.sigmf-meta')
+    return [(f.as_posix(), *stat_key(f)) for f in files]
+
+
+def stat_key(path):
+    st = path.stat()
+    return st.st_mtime, st.st_size
+
+
+def parse_file(path):
+    '''Flatten a .sigmf-meta file, to be run in a worker process
+
+    Returns:
+        A tuple with the path, the JSON record, and an error message if the
+        file couldn't be parsed.
+    '''
+    try:
+        return path, json.dumps(flatten_sigmf(Path(path))), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+class Catalog:
+    '''Persistent index of the SigMF metadata files of a directory
+
+    Flattened metadata is stored in SQLite along with the mtime and size of
+    each file, so only new or modified files are parsed again. Files are
+    indexed by absolute path, so a catalog can hold several directories.
+    Catalogs written by another version of flatten_sigmf() start over.
+
+    Args:
+        path:
+            SQLite database file, created if needed
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'path TEXT PRIMARY KEY, mtime REAL, size INTEGER, record TEXT)'
+        )
+
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != version:
+            self.db.execute('DELETE FROM files')
+            self.db.execute(f'PRAGMA user_version = {version}')
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, directory, jobs=1):
+        '''Index new and modified .sigmf-meta files, drop the removed ones
+
+        Returns:
+            A dict of the files that couldn't be parsed, with the error.
+        '''
+        errors = {}
+        for progress in self.scan(directory, jobs=jobs):
+            errors = progress['errors']
+        return errors
+
+    def scan(self, directory, jobs=1, chunksize=256):
+        '''Same as update(), as a generator reporting progress
+
+        Subdirectories are walked, and files parsed, by a pool of jobs
+        processes. Parsed files are committed by chunks of chunksize files,
+        so the catalog can be read while it is being updated.
+
+        Yields:
+            A dict with the number of files to parse, the number of files
+            parsed so far, the files that couldn't be parsed, and the number
+            of commits so far, for readers to know when to read again.
+        '''
+        directory = Path(directory).resolve()
+        prefix = directory.as_posix() + '/'
+
+        known = {
+            p: (mtime, size)
+            for p, mtime, size in self.db.execute('SELECT path, mtime, size FROM files')
+            if p.startswith(prefix)
+        }
+
+        with ProcessPoolExecutor(jobs) if jobs > 1 else nullcontext() as pool:
+            map_ = pool.map if pool is not None else map
+
+            subdirs = [d for d in directory.iterdir() if d.is_dir()]
+            found = stat_tree(directory, recursive=False)
+            for files in map_(stat_tree, subdirs):
+                found += files
+
+            changed = [(path, mtime, size) for path, mtime, size in found if known.get(path) != (mtime, size)]
+            removed = [(p, ) for p in known.keys() - {path for path, _, _ in found}]
+            self.db.executemany('DELETE FROM files WHERE path = ?', removed)
+            self.db.commit()
+
+            progress = {'total': len(changed), 'parsed': 0, 'errors': {}, 'commits': 1}
+            if removed or not changed:
+                yield dict(progress)
+            if not changed:
+                return
+
+            stats = {path: (mtime, size) for path, mtime, size in changed}
+            kwargs = {'chunksize': max(1, chunksize // jobs)} if pool is not None else {}
+            for path, record, error in map_(parse_file, stats.keys(), **kwargs):
+                progress['parsed'] += 1
+
+                if error is not None:
+                    logger.warning(f'skipping {path}: {error}')
+                    progress['errors'][path] = error
+                else:
+                    self.db.execute(
+                        'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                        (path, *stats[path], record),
+                    )
+
+                if progress['parsed'] % chunksize == 0 or progress['parsed'] == progress['total']:
+                    self.db.commit()
+                    progress['commits'] += 1
+                    yield dict(progress)
+
+    def dataframe(self, directory=None):
+        '''Return the catalog as a DataFrame, one row per file
+
+        Only the files under directory are returned, if set.
+        '''
+        query, args = 'SELECT record FROM files', ()
+        if directory is not None:
+            prefix = Path(directory).resolve().as_posix() + '/'
+            query, args = query + ' WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)
+
+        records = [json.loads(r) for r, in self.db.execute(query + ' ORDER BY path', args)]
+        return pd.json_normalize(records)
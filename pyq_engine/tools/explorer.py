@@ -1,6 +1,8 @@
 import argparse
 import logging
+import threading
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import dash_ag_grid as dag
@@ -8,33 +10,131 @@ import dash_bootstrap_components as dbc
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-import sigmf
 
-from dash import Dash, Input, Output, callback, dcc, html
+from dash import Dash, Input, Output, State, callback, clientside_callback, dcc, html
+from dash.exceptions import PreventUpdate
 
-from pyq_engine import utils
+from pyq_engine import cache
+from pyq_engine.tools.catalog import Catalog
 
 logger = logging.getLogger(__name__)
 
 
-def flatten_sigmf(filename):
-    sig = sigmf.sigmffile.fromfile(filename)
-    m = sig._metadata
+def scan(catalog_path, directory, jobs, status):
+    catalog = Catalog(catalog_path)
+    try:
+        for progress in catalog.scan(directory, jobs=jobs):
+            status.update(progress)
+    finally:
+        catalog.close()
+        status['done'] = True
 
-    if len(m['captures']) > 1:
-           print('warning: many captures in sigmf')
 
-    m['filename'] = filename.as_posix()
-    m['captures.0'] = m['captures'][0]
-    del(m['captures'])
+def load_frame(catalog_path, directory):
+    catalog = Catalog(catalog_path)
+    df = catalog.dataframe(directory)
+    catalog.close()
 
-    return pd.json_normalize(m, meta_prefix=True)
+    # reset row number, and add index column, for graphs
+    return df.reset_index(drop=True).reset_index()
 
 
+def column_fields(column_defs):
+    '''Return the fields of columnDefs, including grouped columns'''
+    fields = []
+    for c in column_defs:
+        if 'children' in c:
+            fields += column_fields(c['children'])
+        elif 'field' in c:
+            fields.append(c['field'])
+    return fields
+
+
+def filter_mask(column, model):
+    '''Return the mask of the rows of column matching an AG Grid filter model'''
+    if 'operator' in model:
+        conditions = model.get('conditions') or [model['condition1'], model['condition2']]
+        masks = [filter_mask(column, c) for c in conditions]
+        combine = np.logical_and if model['operator'] == 'AND' else np.logical_or
+        return combine.reduce(masks)
+
+    kind = model['type']
+    if kind == 'blank':
+        return column.isna()
+    if kind == 'notBlank':
+        return column.notna()
+
+    if model.get('filterType') == 'number':
+        column = pd.to_numeric(column, errors='coerce')
+        value = model['filter']
+        return {
+            'equals': lambda: column == value,
+            'notEqual': lambda: column != value,
+            'lessThan': lambda: column < value,
+            'lessThanOrEqual': lambda: column <= value,
+            'greaterThan': lambda: column > value,
+            'greaterThanOrEqual': lambda: column >= value,
+            'inRange': lambda: column.between(value, model['filterTo']),
+        }[kind]()
+
+    column = column.astype(str).str.lower()
+    value = str(model['filter']).lower()
+    return {
+        'equals': lambda: column == value,
+        'notEqual': lambda: column != value,
+        'contains': lambda: column.str.contains(value, regex=False),
+        'notContains': lambda: ~column.str.contains(value, regex=False),
+        'startsWith': lambda: column.str.startswith(value),
+        'endsWith': lambda: column.str.endswith(value),
+    }[kind]()
+
+
+def get_rows(df, request, fields):
+    '''Answer an AG Grid infinite row model request from a DataFrame
+
+    Rows are filtered and sorted server side, and only the requested block,
+    with the given fields, is returned.
+    '''
+    for field, model in (request.get('filterModel') or {}).items():
+        if field in df.columns:
+            df = df[np.asarray(filter_mask(df[field], model))]
+
+    sort = [s for s in request.get('sortModel') or [] if s['colId'] in df.columns]
+    if sort:
+        df = df.sort_values(
+            by=[s['colId'] for s in sort],
+            ascending=[s['sort'] == 'asc' for s in sort],
+            kind='stable',
+        )
+
+    block = df.iloc[request['startRow']:request['endRow']]
+    block = block[[f for f in fields if f in block.columns]]
+
+    return {
+        'rowData': block.astype(object).replace({np.nan: None}).to_dict('records'),
+        'rowCount': len(df),
+    }
+
+
+def scan_report(status):
+    if status['total'] is None:
+        return 'Scanning metadata files...'
+
+    errors = status['errors']
+    report = [f'Parsed {status["parsed"]}/{status["total"]} new or modified metadata files']
+    if status['done']:
+        report[0] += ', done'
+
+    if errors:
+        report.append(html.Details([
+            html.Summary(f'{len(errors)} files skipped'),
+            html.Ul([html.Li(f'{path}: {error}') for path, error in errors.items()]),
+        ]))
+
+    return report
 
-def main():
-    df = pd.DataFrame()
 
+def main():
     @callback(
         Output('graph', 'figure'),
         Input('grid', 'selectedRows'),
@@ -45,16 +145,10 @@ def main():
         rf_freq = True
         nperseg = 1024
 
-        for i in selected_rows:
-            path = Path(i['filename'])
-            sig = sigmf.sigmffile.fromfile(path)
-            metadata = sig._metadata
-
-            sample_rate = metadata['global']['core:sample_rate']
-            fc = metadata['captures'][0]['core:frequency'] if rf_freq else 0
-            samples = sig.read_samples()
+        paths = [i['filename'] for i in selected_rows]
+        psds = psd_cache.get_many(paths, nperseg=nperseg, rf_freq=rf_freq, map_=pool.map if pool else map)
 
-            f, psd = utils.samples_to_psd(samples, sample_rate, fc=fc, nperseg=nperseg)
+        for i, (f, psd) in zip(selected_rows, psds):
             fig.add_trace(go.Scatter(
                 x=f,
                 y=psd,
@@ -79,36 +173,95 @@ def main():
 
     parser = argparse.ArgumentParser('pyq-explorer')
     parser.add_argument('dir', type=Path, default='.')
+    parser.add_argument('--catalog', type=Path, help='metadata catalog, defaults to catalog.sqlite in the user cache directory')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='number of processes scanning metadata files and computing PSDs')
+    parser.add_argument('--psd-cache', type=Path, help='PSD cache directory, defaults to psd in the user cache directory')
     options = parser.parse_args()
 
     if not options.dir.exists():
         logger.critical('input directory doesn\'t exist')
         return
 
+    psd_cache = cache.PSDCache(options.psd_cache or cache.user_dir() / 'psd')
+    pool = ProcessPoolExecutor(options.jobs) if options.jobs > 1 else None
+
     app = Dash(
         __name__,
         title='PYQ-Explorer',
         external_stylesheets=[dbc.themes.BOOTSTRAP],
     )
 
-    for f in options.dir.glob('**/*.sigmf-meta'):
-        try:
-            df = pd.concat([df, flatten_sigmf(f)])
-        except Exception as e:
-            logger.warning(f'skipping {f}: {e}')
+    catalog_path = options.catalog or cache.user_dir() / 'catalog.sqlite'
+    scan_status = {'total': None, 'parsed': 0, 'errors': {}, 'commits': 0, 'done': False}
+    scan_lock = threading.Lock()
+    scan_thread = threading.Thread(target=scan, args=(catalog_path, options.dir, options.jobs, scan_status), daemon=True)
 
-    # reset row number, and add index column, for graphs
-    df = df.replace({np.nan: None}).reset_index(drop=True).reset_index()
+    frame = {'commits': None, 'df': None}
+    frame_lock = threading.Lock()
+
+    def get_frame():
+        # reload the catalog once per commit, of parsed or removed files
+        with frame_lock:
+            if frame['df'] is None or frame['commits'] != scan_status['commits']:
+                frame['commits'] = scan_status['commits']
+                frame['df'] = load_frame(catalog_path, options.dir)
+            return frame['df']
+
+    @callback(
+        Output('grid', 'getRowsResponse'),
+        Input('grid', 'getRowsRequest'),
+    )
+    def update_rows(request):
+        if request is None:
+            raise PreventUpdate
+        return get_rows(get_frame(), request, column_fields(columnDefs))
+
+    # drop the rows cached by the grid, so it requests them again
+    clientside_callback(
+        '''function(commits) {
+            const api = dash_ag_grid.getApi('grid');
+            if (api) {
+                api.purgeInfiniteCache();
+            }
+            return window.dash_clientside.no_update;
+        }''',
+        Output('grid-refresh', 'data'),
+        Input('scan-store', 'data'),
+        prevent_initial_call=True,
+    )
+
+    @callback(
+        [
+            Output('scan-status', 'children'),
+            Output('scan-interval', 'disabled'),
+            Output('scan-store', 'data'),
+        ],
+        Input('scan-interval', 'n_intervals'),
+        State('scan-store', 'data'),
+    )
+    def update_scan(n_intervals, commits):
+        # start scanning from the process serving requests, not the reloader
+        with scan_lock:
+            if not scan_thread.is_alive() and not scan_status['done']:
+                scan_thread.start()
+
+        # only refresh the grid when the catalog was committed
+        status = dict(scan_status)
+        if n_intervals and status['commits'] == commits and not status['done']:
+            raise PreventUpdate
+
+        return scan_report(status), status['done'], status['commits']
 
     columnDefs = [
-        {'headerName': 'Row ID', 'valueGetter': {'function': 'params.data.index'}, 'headerCheckboxSelection': True },
+        {'headerName': 'Row ID', 'field': 'index', 'filter': 'agNumberColumnFilter'},
         {'field': 'filename', 'initialHide': True },
         {
             'headerName': 'Global.Core',
             'children': [
                 {'field': 'global.core:author', 'headerName': 'Author', 'initialHide': True},
                 {'field': 'global.core:datatype', 'headerName': 'Data Type', 'initialHide': True},
-                {'field': 'global.core:sample_rate', 'headerName': 'Sample Rate'},
+                {'field': 'global.core:num_channels', 'headerName': 'Channels', 'filter': 'agNumberColumnFilter', 'initialHide': True},
+                {'field': 'global.core:sample_rate', 'headerName': 'Sample Rate', 'filter': 'agNumberColumnFilter'},
                 {'field': 'global.core:version', 'headerName': 'Version', 'initialHide': True},
             ],
         },
@@ -130,7 +283,10 @@ def main():
             'headerName': 'Captures[0]',
             'children': [
                 {'field': 'captures.0.core:datetime', 'headerName': 'Datetime'},
-                {'field': 'captures.0.core:frequency', 'headerName': 'Frequency'},
+                {'field': 'captures.0.core:frequency', 'headerName': 'Frequency', 'filter': 'agNumberColumnFilter'},
+                {'field': 'segments', 'headerName': 'Segments', 'filter': 'agNumberColumnFilter'},
+                {'field': 'frequency.min', 'headerName': 'Min Frequency', 'filter': 'agNumberColumnFilter', 'initialHide': True},
+                {'field': 'frequency.max', 'headerName': 'Max Frequency', 'filter': 'agNumberColumnFilter', 'initialHide': True},
                 {'field': 'captures.0.core:sample_start', 'headerName': 'Sample Start', 'initialHide': True},
                 {'field': 'captures.0.he360:timesource', 'headerName': 'HE360 Timesource'},
             ],
@@ -141,11 +297,14 @@ def main():
         dag.AgGrid(
             id='grid',
             columnDefs=columnDefs,
-            rowData=df.to_dict('records'),
+            rowModelType='infinite',
+            getRowId='params.data.filename',
             dashGridOptions={
                 'rowSelection': 'multiple',
                 'rowMultiSelectWithClick': True,
                 'suppressFieldDotNotation': True,
+                'cacheBlockSize': 100,
+                'maxBlocksInCache': 20,
             },
             columnSize='responsiveSizeToFit',
             defaultColDef={
@@ -162,6 +321,10 @@ def main():
         [
             html.H1('PYQ Explorer'),
             html.Hr(),
+            dcc.Interval(id='scan-interval', interval=1000),
+            dcc.Store(id='scan-store'),
+            dcc.Store(id='grid-refresh'),
+            html.Div(id='scan-status'),
             dbc.Tabs(
                 [
                     dbc.Tab(
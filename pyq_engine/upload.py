@@ -0,0 +1,97 @@
+import fcntl
+import hashlib
+import json
+import os
+
+import flask
+
+from pyq_engine import cache
+
+blueprint = flask.Blueprint('upload', __name__)
+
+
+def upload_key(name, size, modified):
+    '''Key of an upload, the same file uploaded again gets the same key'''
+    key = json.dumps([name, size, modified])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def check_key(key):
+    if not cache.is_spool_key(key):
+        flask.abort(404)
+
+
+@blueprint.route('/upload', methods=['POST'])
+def start():
+    '''Start or resume an upload
+
+    Expects a JSON body with the file name, size and modification time, and
+    returns the upload key along with the offset to upload from.
+    '''
+    info = flask.request.get_json()
+    key = upload_key(info['name'], info['size'], info['modified'])
+    part = cache.spool_path(key, '.part')
+
+    if cache.spool_path(key).exists():
+        return {'key': key, 'offset': info['size'], 'done': True}
+
+    if not part.exists():
+        cache.clean_spool()
+        part.touch()
+
+    return {'key': key, 'offset': part.stat().st_size, 'done': False}
+
+
+@blueprint.route('/upload/<key>', methods=['PUT'])
+def chunk(key):
+    '''Append a chunk to an upload
+
+    The offset and total size of the upload are passed as query arguments,
+    chunks have to be sent in order. The file is moved in place once the
+    last chunk is written.
+
+    The same file uploaded from several tabs has the same key, the upload
+    is locked while a chunk is appended, and its offset checked again once
+    locked, so that concurrent chunks are never both written.
+    '''
+    check_key(key)
+    offset = flask.request.args.get('offset', type=int)
+    size = flask.request.args.get('size', type=int)
+    part = cache.spool_path(key, '.part')
+
+    if offset is None or size is None:
+        flask.abort(400)
+
+    try:
+        f = open(part, 'r+b')
+    except FileNotFoundError:
+        return completed(key)
+
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        if not part.exists():
+            # moved in place while waiting for the lock
+            return completed(key)
+
+        current = f.seek(0, os.SEEK_END)
+        if offset != current:
+            return {'key': key, 'offset': current, 'done': False}, 409
+
+        while data := flask.request.stream.read(2**20):
+            f.write(data)
+        current = f.tell()
+
+        done = current >= size
+        if done:
+            part.rename(cache.spool_path(key))
+
+    return {'key': key, 'offset': current, 'done': done}
+
+
+def completed(key):
+    '''Response to a chunk of an upload completed by another request'''
+    path = cache.spool_path(key)
+    if not path.exists():
+        flask.abort(404)
+
+    return {'key': key, 'offset': path.stat().st_size, 'done': True}, 409
@@ -1,16 +1,9 @@
-import io
-import sigmf
 import base64
 import pandas as pd
 import numpy as np
-from scipy import signal
+from scipy import fft, signal
 
-
-def load_sigmf_contents(contents):
-    content_type, content_string = contents.split(',')
-    d = io.BytesIO(base64.b64decode(content_string))
-    arc = sigmf.SigMFArchiveReader(archive_buffer=d)
-    return arc.sigmffile
+from pyq_engine.capture import Capture
 
 
 def serialize_samples(samples: np.ndarray) -> dict[str, str]:
@@ -25,26 +18,191 @@ def deserialize_samples(store: dict[str, str]) -> np.ndarray:
     return np.frombuffer(buffer, dtype=dtype)
 
 
+class WelchAccumulator:
+    '''Welch PSD computed incrementally, over consecutive chunks of samples
+
+    Segment periodograms are summed as chunks come in, samples that don't
+    fill a complete segment are kept for the next chunk, so the result is
+    the same as signal.welch() on the concatenated chunks, in bounded memory.
+
+    Args:
+        sample_rate:
+            sample rate in Hz
+        fc:
+            center frequency in Hz
+        nperseg:
+            segment size, also the FFT size
+        noverlap:
+            number of samples shared by consecutive segments, defaults to
+            half a segment like signal.welch()
+        window:
+            window passed to signal.get_window()
+    '''
+
+    def __init__(self, sample_rate, fc=0, nperseg=1024*8, noverlap=None, window='hann'):
+        self.sample_rate = sample_rate
+        self.fc = fc
+        self.nperseg = nperseg
+        self.noverlap = nperseg // 2 if noverlap is None else noverlap
+        self.window = signal.get_window(window, nperseg)
+
+        self.segments = 0
+        self._sum = np.zeros(nperseg)
+        self._tail = np.empty(0, dtype=np.complex64)
+
+    def update(self, chunk):
+        samples = np.concatenate([self._tail, chunk])
+        frames = frame_samples(samples, self.nperseg, self.noverlap)
+
+        # scipy keeps single precision samples in single precision
+        frames = frames - frames.mean(axis=1, keepdims=True)
+        spectrum = fft.fft(frames * self.window.astype(frames.real.dtype), axis=1)
+        self._sum += (np.abs(spectrum)**2).sum(axis=0)
+        self.segments += len(frames)
+
+        self._tail = samples[len(frames) * (self.nperseg - self.noverlap):]
+
+    def result(self):
+        '''Return the PSD averaged over the segments seen so far
+
+        Returns:
+            A tuple with the frequency axis, and the PSD in dB.
+        '''
+        psd = self._sum / max(self.segments, 1) / self.window.sum()**2
+        psd_db = 10 * np.log10(np.fft.fftshift(psd) / self.nperseg)
+        f = np.linspace(self.fc - self.sample_rate / 2, self.fc + self.sample_rate / 2, self.nperseg)
+        return f, psd_db
+
+
+def stream_psd(source, sample_rate, fc=0, nperseg=1024*8, chunk_size=2**22):
+    '''Compute the PSD of a sample source, chunk by chunk
+
+    Args:
+        source:
+            anything that can be sliced, like a numpy array or a Capture
+        chunk_size:
+            number of samples read at a time
+
+    Yields:
+        The partial (f, psd) result after each chunk, the last one covering
+        the whole source.
+    '''
+    acc = WelchAccumulator(sample_rate, fc=fc, nperseg=nperseg)
+    for start in range(0, max(len(source), 1), chunk_size):
+        acc.update(source[start:start + chunk_size])
+        yield acc.result()
+
+
 def samples_to_psd(samples, sample_rate, fc=0, nperseg=1024*8):
-    _, psd = signal.welch(samples, fs=sample_rate, scaling='spectrum', return_onesided=False, nperseg=nperseg)
-    psd_db = 10 * np.log10(np.abs((np.fft.fftshift((psd)))/(len(psd))))
-    f = np.linspace(fc - sample_rate / 2, fc + sample_rate / 2, len(psd))
+    if len(samples) < nperseg:
+        # let signal.welch() shrink the segment size
+        _, psd = signal.welch(samples[:], fs=sample_rate, scaling='spectrum', return_onesided=False, nperseg=nperseg)
+        psd_db = 10 * np.log10(np.abs((np.fft.fftshift((psd)))/(len(psd))))
+        f = np.linspace(fc - sample_rate / 2, fc + sample_rate / 2, len(psd))
+        return f, psd_db
+
+    for f, psd_db in stream_psd(samples, sample_rate, fc=fc, nperseg=nperseg):
+        pass
     return f, psd_db
 
 
-def sigmf_to_spectrogram(samples, sample_rate, nperseg=1024, fc=0):
-    num_rows = len(samples) // nperseg # // is an integer division which rounds down
-    spectrogram = np.zeros((num_rows, nperseg))
+def capture_psd(path, nperseg=1024, rf_freq=True):
+    '''Compute the PSD of the first capture segment of a recording
+
+    Returns:
+        A (2, nperseg) array, with the frequency axis and the PSD in dB.
+    '''
+    capture = Capture.open(path)
+    start, stop, frequency = capture.segments()[0]
+    fc = frequency if rf_freq else 0
+    return np.stack(samples_to_psd(capture.slice(start, stop), capture.sample_rate, fc=fc, nperseg=nperseg))
+
+
+def frame_samples(samples, nperseg, noverlap=0):
+    '''Return a strided (rows, nperseg) view of samples, without copying
+
+    Rows start every `nperseg - noverlap` samples, trailing samples that don't
+    fill a complete row are dropped.
+    '''
+    step = nperseg - noverlap
+    if step <= 0:
+        raise ValueError('noverlap must be smaller than nperseg')
+
+    if len(samples) < nperseg:
+        return np.empty((0, nperseg), dtype=samples.dtype)
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, nperseg)
+    return frames[::step]
+
+
+def sigmf_to_spectrogram(samples, sample_rate, nperseg=1024, fc=0, noverlap=0, window='hann'):
+    '''Compute a spectrogram, one PSD per row
+
+    Rows are computed in a single batched FFT, and scaled like
+    samples_to_psd() would for a single segment of nperseg samples.
+
+    Args:
+        samples:
+            complex samples
+        sample_rate:
+            sample rate in Hz
+        nperseg:
+            number of samples per row, also the FFT size
+        fc:
+            center frequency in Hz
+        noverlap:
+            number of samples shared by consecutive rows
+        window:
+            window passed to signal.get_window()
 
-    for i in range(num_rows):
-        start = i * nperseg
-        stop = (i + 1) * nperseg
+    Returns:
+        A tuple with the frequency axis, and a (rows, nperseg) array in dB.
+    '''
+    frames = frame_samples(samples, nperseg, noverlap)
+    win = signal.get_window(window, nperseg)
 
-        f, spectrogram[i,:] = samples_to_psd(samples[start:stop], sample_rate, fc, nperseg=nperseg)
+    # same as signal.welch(detrend='constant', scaling='spectrum') on a
+    # single segment
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    spectrum = fft.fft(frames * win.astype(frames.real.dtype), axis=1)
+    psd = np.abs(spectrum)**2 / win.sum()**2
 
+    spectrogram = 10 * np.log10(np.fft.fftshift(psd, axes=1) / nperseg)
+    f = np.linspace(fc - sample_rate / 2, fc + sample_rate / 2, nperseg)
     return f, spectrogram
 
 
+def minmax_decimate(y: np.ndarray, max_points: int) -> np.ndarray:
+    '''Return the indexes of the min and max of y over max_points // 2 buckets
+
+    The envelope of the signal, and so peaks and transients, is kept while
+    the number of points stays within max_points.
+    '''
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    return minmax_buckets(y, -(-n // (max_points // 2)))
+
+
+def minmax_buckets(y: np.ndarray, size: int) -> np.ndarray:
+    '''Return the indexes of the min and max of y over buckets of size
+    samples, the last bucket being shorter if needed'''
+    n = len(y)
+    buckets = -(-n // size)
+
+    # pad the last bucket by repeating the last sample
+    padded = np.pad(y, (0, buckets * size - n), mode='edge').reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+
+    idxs = np.concatenate([
+        offsets + padded.argmin(axis=1),
+        offsets + padded.argmax(axis=1),
+    ])
+
+    return np.unique(np.minimum(idxs, n - 1))
+
+
 def get_peaks(freqs: np.ndarray, fftdb: np.ndarray, bandwidth: float=None, **kwargs) -> pd.DataFrame:
     '''Get FFT peaks using signal.find_peaks()
 
@@ -76,9 +234,96 @@ def get_peaks(freqs: np.ndarray, fftdb: np.ndarray, bandwidth: float=None, **kwa
     df = pd.DataFrame(props)
     df['indexes'] = peak_idxs
     df['center freq'] = freqs[peak_idxs]
-    df['left freq'] = freqs[[int(i) for i in props['left_ips']]]
-    df['right freq'] = freqs[[int(i) for i in props['right_ips']]]
+    df['left freq'] = freqs[props['left_ips'].astype(int)]
+    df['right freq'] = freqs[props['right_ips'].astype(int)]
     df['bandwidth'] = df['right freq'] - df['left freq']
     df['dBs'] = fftdb[peak_idxs]
 
     return df.sort_values('dBs', ascending=False)
+
+
+detection_dtype = np.dtype([
+    ('time', np.float64),
+    ('freq', np.float64),
+    ('bandwidth', np.float64),
+    ('dB', np.float32),
+])
+
+
+def detect_bursts(freqs: np.ndarray, times: np.ndarray, spectrogram: np.ndarray, threshold: float=10, min_bandwidth: float=0) -> np.ndarray:
+    '''Detect bursts in every row of a spectrogram at once
+
+    Bins more than threshold dB above the noise floor of their row, taken as
+    the median of the row, are grouped in runs of adjacent bins. Each run is
+    a detection.
+
+    Args:
+        freqs:
+            x-axis frequency range, as returned by sigmf_to_spectrogram()
+        times:
+            time of each row of the spectrogram
+        spectrogram:
+            (rows, nperseg) array in dB
+        threshold:
+            detection threshold in dB above the noise floor
+        min_bandwidth:
+            minimal bandwidth of a detection in Hz
+
+    Returns:
+        A structured array of detection_dtype, with the time of the row,
+        center frequency, bandwidth and peak power in dB of each detection,
+        ordered by time then frequency.
+    '''
+    rows, nperseg = spectrogram.shape
+    if rows == 0:
+        return np.empty(0, dtype=detection_dtype)
+
+    floor = np.median(spectrogram, axis=1, keepdims=True)
+    mask = spectrogram > floor + threshold
+
+    # runs start where the mask goes up and stop where it goes down, padding
+    # each row so that runs never span two rows
+    padded = np.zeros((rows, nperseg + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    row, start = np.nonzero(edges == 1)
+    _, stop = np.nonzero(edges == -1)
+
+    df = freqs[1] - freqs[0]
+    bandwidth = (stop - start) * df
+    keep = bandwidth >= min_bandwidth
+    row, start, stop, bandwidth = row[keep], start[keep], stop[keep], bandwidth[keep]
+
+    detections = np.empty(len(row), dtype=detection_dtype)
+    if len(row) == 0:
+        return detections
+
+    detections['time'] = times[row]
+    detections['freq'] = (freqs[start] + freqs[stop - 1]) / 2
+    detections['bandwidth'] = bandwidth
+    # max over [start, stop) of each run, from the flattened spectrogram,
+    # padded for the runs ending on the last bin
+    flat = np.append(spectrogram.ravel(), 0)
+    bounds = np.stack([row * nperseg + start, row * nperseg + stop], axis=1).ravel()
+    detections['dB'] = np.maximum.reduceat(flat, bounds)[::2]
+
+    return detections
+
+
+def annotated(detections: np.ndarray, annotations: list, sample_rate: float) -> np.ndarray:
+    '''Return whether each detection falls within one of the annotations
+
+    Annotations without a sample count extend to the end of the capture,
+    and annotations without frequency edges cover the whole band.
+    '''
+    if not annotations or len(detections) == 0:
+        return np.zeros(len(detections), dtype=bool)
+
+    t0 = np.array([a['core:sample_start'] for a in annotations]) / sample_rate
+    t1 = t0 + np.array([a.get('core:sample_count', np.inf) for a in annotations]) / sample_rate
+    f0 = np.array([a.get('core:freq_lower_edge', -np.inf) for a in annotations])
+    f1 = np.array([a.get('core:freq_upper_edge', np.inf) for a in annotations])
+
+    t = detections['time'][:, None]
+    f = detections['freq'][:, None]
+    return ((t >= t0) & (t < t1) & (f >= f0) & (f <= f1)).any(axis=1)
@@ -0,0 +1,43 @@
+import json
+
+import numpy as np
+import pytest
+
+
+def write_sigmf(path, samples=(), datatype='cf32_le', sample_rate=1e6, frequency=0, captures=None, annotations=None, global_fields=None):
+    '''Write a .sigmf-meta/.sigmf-data pair
+
+    Args:
+        path:
+            path of the recording, its suffix is replaced
+        samples:
+            array written as-is, or an iterable of arrays written one after
+            the other, for recordings larger than memory
+        captures:
+            SigMF captures, defaults to a single segment at frequency
+        global_fields:
+            extra fields of the global object
+
+    Returns:
+        The path of the .sigmf-meta file.
+    '''
+    meta = {
+        'global': {'core:datatype': datatype, 'core:sample_rate': sample_rate, **(global_fields or {})},
+        'captures': captures if captures is not None else [{'core:sample_start': 0, 'core:frequency': frequency}],
+        'annotations': annotations or [],
+    }
+    path.with_suffix('.sigmf-meta').write_text(json.dumps(meta))
+
+    if isinstance(samples, np.ndarray):
+        samples = [samples]
+    with open(path.with_suffix('.sigmf-data'), 'wb') as f:
+        for chunk in samples:
+            chunk.tofile(f)
+
+    return path.with_suffix('.sigmf-meta')
+
+
+@pytest.fixture(scope='session')
+def write_capture():
+    '''Function writing a SigMF recording, see write_sigmf()'''
+    return write_sigmf
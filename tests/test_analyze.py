@@ -0,0 +1,59 @@
+import numpy as np
+from pyq_engine.tools import analyze
+
+
+def tone(frequency, n=8192):
+    t = np.arange(n) / 1e6
+    return (np.exp(2j * np.pi * frequency * t) + 0.01 * np.random.randn(n)).astype(np.complex64)
+
+
+def test_analyze_resume(tmp_path, write_capture):
+    captures = tmp_path / 'captures'
+    captures.mkdir()
+    write_capture(captures / 'a', tone(100e3), frequency=1e9)
+    write_capture(captures / 'b', tone(-200e3), frequency=2e9)
+    (captures / 'broken.sigmf-meta').write_text('{')
+    output = tmp_path / 'analysis'
+
+    progress = list(analyze.analyze(captures, output, nperseg=256, chunksize=2))
+
+    assert [p['analyzed'] for p in progress] == [2, 3]
+    assert list(progress[-1]['errors'].keys()) == [(captures / 'broken.sigmf-meta').as_posix()]
+
+    results = analyze.Results(output)
+    summary = results.summary()
+    assert list(summary['frequency']) == [1e9, 2e9]
+    assert np.allclose(summary['power'], 0, atol=0.1)
+
+    peaks = results.peaks()
+    top = peaks.sort_values('dBs').groupby('filename').last()
+    assert np.allclose(top['center freq'], [1e9 + 100e3, 2e9 - 200e3], atol=1e6 / 256)
+
+    psds = results.psds()
+    assert psds[(captures / 'a.sigmf-meta').as_posix()].shape == (2, 256)
+
+    # only the broken and modified captures are analyzed again
+    write_capture(captures / 'b', tone(50e3), frequency=3e9)
+    progress = list(analyze.analyze(captures, output, nperseg=256))
+    assert progress[-1]['total'] == 2
+    assert list(results.summary()['frequency']) == [1e9, 3e9]
+
+    peaks = results.peaks()
+    top = peaks.sort_values('dBs').groupby('filename').last()
+    assert np.allclose(top['center freq'], [1e9 + 100e3, 3e9 + 50e3], atol=1e6 / 256)
+    assert (peaks['center freq'][peaks['filename'].str.endswith('b.sigmf-meta')] > 2.5e9).all()
+
+    # rewriting only the samples is a modification too
+    tone(100e3, n=4096).tofile(captures / 'b.sigmf-data')
+    progress = list(analyze.analyze(captures, output, nperseg=256))
+    assert progress[-1]['total'] == 2
+    assert list(results.summary()['samples']) == [8192, 4096]
+
+
+def test_default_output(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_STATE_HOME', tmp_path.as_posix())
+
+    a = analyze.default_output(tmp_path / 'a')
+    assert a.parent == tmp_path / 'pyq-engine' / 'analysis'
+    assert a.name.startswith('a-')
+    assert a != analyze.default_output(tmp_path / 'b' / 'a')
@@ -0,0 +1,27 @@
+import diskcache
+from pyq_engine import app, cache, metrics
+
+
+def test_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'root', None)
+    monkeypatch.setattr(cache, 'cache_dir', tmp_path)
+    monkeypatch.setattr(cache, 'jobs', cache.DiskCache('jobs'))
+    monkeypatch.setattr(metrics, 'store', diskcache.Cache((tmp_path / 'metrics').as_posix()))
+    metrics.inc('pyq_engine_cache_hits_total', 'tiles')
+
+    server = app.server('--root', tmp_path.as_posix())
+
+    assert cache.root == tmp_path
+    assert server.test_client().get('/').status_code == 200
+    # another worker starting doesn't reset the counters
+    assert metrics.collect()['pyq_engine_cache_hits_total'] == {'tiles': 1}
+
+
+def test_parse_args():
+    options = app.parse_args([])
+    assert options.command == 'run'
+    assert not options.debug
+
+    options = app.parse_args(['serve', '--workers', '3'])
+    assert options.command == 'serve'
+    assert options.workers == 3
@@ -0,0 +1,155 @@
+import diskcache
+import numpy as np
+import pytest
+from pyq_engine import cache
+from pyq_engine.capture import Capture
+
+
+def test_sample_cache_zero_copy():
+    c = cache.SampleCache()
+    samples = np.random.rand(10).view(dtype=np.complex128)
+
+    key = c.put(samples)
+    out = c.get(key)
+
+    assert np.shares_memory(samples, out)
+    assert not out.flags.writeable
+    assert c.get('missing') is None
+
+
+def test_sample_cache_eviction():
+    samples = np.zeros(100, dtype=np.complex64)
+    c = cache.SampleCache(max_bytes=2 * samples.nbytes)
+
+    a = c.put(samples)
+    b = c.put(samples.copy())
+    c.get(a)
+    d = c.put(samples.copy())
+
+    assert a in c
+    assert b not in c
+    assert d in c
+    assert c.nbytes <= c.max_bytes
+
+
+def test_spooled_capture(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'spool_dir', tmp_path / 'spool')
+    samples = np.arange(8, dtype=np.float32).view(np.complex64)
+    meta = '{"global": {"core:datatype": "cf32_le", "core:sample_rate": 1}}'
+
+    key, missing, partial = 'a' * 40, 'b' * 40, 'c' * 40
+    cache.spool_path(key, '.sigmf-meta').write_text(meta)
+    cache.spool_path(key, '.sigmf-data').write_bytes(samples.tobytes())
+    cache.spool_path(partial, '.part').write_bytes(samples.tobytes())
+
+    capture = cache.get_capture(key)
+
+    assert len(capture) == 4
+    assert np.array_equal(capture[1:3], samples[1:3])
+    assert cache.get_capture(missing) is None
+    assert cache.get_capture(partial) is None
+
+    # keys come from the browser, they can't point outside of the spool
+    (tmp_path / 'outside.sigmf-meta').write_text(meta)
+    (tmp_path / 'outside.sigmf-data').write_bytes(samples.tobytes())
+    for invalid in ('../outside', '*', 'A' * 40):
+        with pytest.raises(ValueError):
+            cache.get_capture(invalid)
+
+
+def test_psd_cache(tmp_path, monkeypatch):
+    samples = np.random.rand(2 * 4096).astype(np.float32).view(np.complex64)
+    samples.tofile(tmp_path / 'a.sigmf-data')
+    meta = '{"global": {"core:datatype": "cf32_le", "core:sample_rate": 1e6}, "captures": [{"core:frequency": 1e9}]}'
+    (tmp_path / 'a.sigmf-meta').write_text(meta)
+    path = (tmp_path / 'a.sigmf-meta').as_posix()
+
+    psds = cache.PSDCache(tmp_path / 'psd').get_many([path], nperseg=256)
+    assert psds[0].shape == (2, 256)
+
+    computed = []
+    monkeypatch.setattr(cache.utils, 'capture_psd', lambda *args: computed.append(args))
+
+    # a new cache instance still finds the PSD on disk
+    again = cache.PSDCache(tmp_path / 'psd').get_many([path], nperseg=256)
+    assert np.array_equal(again[0], psds[0])
+    assert computed == []
+
+
+def test_root_capture(tmp_path, monkeypatch, write_capture):
+    monkeypatch.setattr(cache, 'root', tmp_path)
+    monkeypatch.setattr(cache, 'samples', cache.SampleCache())
+    samples = np.arange(8, dtype=np.float32).view(np.complex64)
+    write_capture(tmp_path / 'a', samples, sample_rate=1)
+
+    key = cache.capture_key('path:a.sigmf-meta')
+    capture = cache.get_capture('path:a.sigmf-meta')
+
+    assert np.array_equal(capture[:], samples)
+    assert cache.get_capture(key) is capture
+    assert cache.get_capture('path:b.sigmf-meta') is None
+    with pytest.raises(ValueError):
+        cache.get_capture('path:../a.sigmf-meta')
+
+    # rewriting the capture changes its key, nothing cached for the previous
+    # content is used again
+    write_capture(tmp_path / 'a', 5 * np.ones(8, dtype=np.complex64), sample_rate=1)
+
+    assert cache.capture_key('path:a.sigmf-meta') != key
+    assert cache.get_capture(key) is None
+    assert np.array_equal(cache.get_capture('path:a.sigmf-meta')[:], 5 * np.ones(8))
+
+
+def test_latest_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'requests', diskcache.Cache(tmp_path.as_posix()))
+
+    first = cache.latest_request('a', cache.new_request('a'))
+    assert first()
+
+    other = cache.latest_request('b', cache.new_request('b'))
+    assert first()
+    assert other()
+
+    second = cache.latest_request('a', cache.new_request('a'))
+    assert not first()
+    assert second()
+
+
+def test_user_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', tmp_path.as_posix())
+    monkeypatch.delenv('XDG_STATE_HOME', raising=False)
+    monkeypatch.setenv('HOME', tmp_path.as_posix())
+
+    assert cache.user_dir() == tmp_path / 'pyq-engine'
+    assert cache.user_dir('state') == tmp_path / '.local' / 'state' / 'pyq-engine'
+
+
+def test_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'cache_dir', tmp_path / 'server')
+    c = cache.DiskCache('test', size_limit=2**20)
+
+    # nothing is created before the cache is used
+    assert not (tmp_path / 'server').exists()
+
+    c.set('a', 1)
+    assert 'a' in c
+    assert list(c) == ['a']
+    assert c.size_limit == 2**20
+    assert (tmp_path / 'server' / 'test').is_dir()
+
+
+def test_sample_cache_captures(tmp_path, write_capture):
+    path = write_capture(tmp_path / 'capture', np.zeros(2**16, dtype=np.complex64))
+    c = cache.SampleCache(max_bytes=2**16, max_entries=3)
+
+    samples = c.put(np.zeros(2**12, dtype=np.complex64))
+    keys = [c.put(Capture.open(path)) for _ in range(2)]
+
+    # mapped samples aren't held in memory, they don't evict other entries
+    assert samples in c
+    assert c.nbytes < 2**16
+
+    c.put(Capture.open(path))
+    assert samples not in c
+    assert all(key in c for key in keys)
+
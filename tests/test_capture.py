@@ -0,0 +1,92 @@
+import numpy as np
+from pyq_engine import capture
+
+
+def test_parse_datatype():
+    assert capture.parse_datatype('cf32_le') == (np.dtype('<f4'), True)
+    assert capture.parse_datatype('ci16_be') == (np.dtype('>i2'), True)
+    assert capture.parse_datatype('ru8') == (np.dtype('u1'), False)
+
+
+def test_capture_cf32(tmp_path, write_capture):
+    samples = np.random.rand(20).astype(np.float32).view(np.complex64)
+    write_capture(tmp_path / 'test', samples, 'cf32_le')
+
+    c = capture.Capture.open(tmp_path / 'test.sigmf-meta')
+
+    assert len(c) == len(samples)
+    assert np.array_equal(c[2:5], samples[2:5])
+
+
+def test_capture_ci16(tmp_path, write_capture):
+    samples = np.array([0, 2**14, -2**15, 2**15 - 1], dtype='<i2')
+    write_capture(tmp_path / 'test', samples, 'ci16_le')
+
+    c = capture.Capture.open(tmp_path / 'test.sigmf-data')
+
+    assert len(c) == 2
+    assert c[:].dtype == np.complex64
+    assert np.allclose(c[:], [0.5j, -1 + (2**15 - 1) / 2**15 * 1j])
+
+
+def test_capture_archive(tmp_path, write_capture):
+    import sigmf
+
+    samples = np.random.rand(20).astype(np.float32).view(np.complex64)
+    write_capture(tmp_path / 'test', samples, 'cf32_le')
+    meta = sigmf.sigmffile.fromfile((tmp_path / 'test.sigmf-meta').as_posix())
+    with open(tmp_path / 'archive.sigmf', 'wb') as f:
+        meta.archive(fileobj=f)
+
+    c = capture.Capture.open(tmp_path / 'archive.sigmf')
+
+    assert len(c) == len(samples)
+    assert np.array_equal(c[:], samples)
+
+
+def test_capture_slice_chunks(tmp_path, write_capture):
+    samples = np.arange(2000, dtype='<i2') - 1000
+    write_capture(tmp_path / 'test', samples, 'ci16_le')
+    c = capture.Capture.open(tmp_path / 'test.sigmf-meta')
+
+    s = c.slice(100, 600)
+    chunks = list(s.chunks(chunk_size=128))
+
+    assert len(s) == 500
+    assert [len(chunk) for chunk in chunks] == [128, 128, 128, 116]
+    assert all(chunk.dtype == np.complex64 for chunk in chunks)
+    assert np.array_equal(np.concatenate(chunks), c[100:600])
+
+
+def test_capture_segments(tmp_path, write_capture):
+    captures = [
+        {'core:sample_start': 1000, 'core:frequency': 2e9},
+        {'core:sample_start': 0, 'core:frequency': 1e9},
+        {'core:sample_start': 1500, 'core:frequency': 3e9},
+    ]
+    write_capture(tmp_path / 'test', np.zeros(2000, dtype=np.complex64), captures=captures)
+
+    c = capture.Capture.open(tmp_path / 'test.sigmf-meta')
+
+    assert c.segments().tolist() == [(0, 1000, 1e9), (1000, 1500, 2e9), (1500, 2000, 3e9)]
+    assert c.segments(900, 1200).tolist() == [(900, 1000, 1e9), (1000, 1200, 2e9)]
+    assert c.segments(1000, 1100).tolist() == [(1000, 1100, 2e9)]
+    assert c.frequency(1499) == 2e9
+    assert c.frequency(1500) == 3e9
+
+    # segments of a slice are relative to the slice
+    s = c.slice(1200, 1800)
+    assert s.segments().tolist() == [(0, 300, 2e9), (300, 600, 3e9)]
+    assert s.frequency(0) == 2e9
+
+
+def test_capture_channels(tmp_path, write_capture):
+    samples = np.arange(12, dtype='<i2')
+    write_capture(tmp_path / 'test', samples, 'ci16_le', global_fields={'core:num_channels': 3})
+
+    c = capture.Capture.open(tmp_path / 'test.sigmf-meta')
+
+    assert len(c) == 2
+    assert np.allclose(c[:] * 2**15, [0 + 1j, 6 + 7j])
+    assert np.allclose(c.channel(2)[:] * 2**15, [4 + 5j, 10 + 11j])
+    assert np.allclose(c.slice(1, 2).channel(1)[:] * 2**15, [8 + 9j])
@@ -0,0 +1,109 @@
+from pyq_engine.tools import catalog
+
+
+def test_catalog_incremental(tmp_path, monkeypatch, write_capture):
+    write_capture(tmp_path / 'a', frequency=1e9)
+    write_capture(tmp_path / 'b', frequency=2e9)
+    (tmp_path / 'broken.sigmf-meta').write_text('{')
+
+    c = catalog.Catalog(tmp_path / 'catalog.sqlite')
+    errors = c.update(tmp_path)
+    df = c.dataframe()
+
+    assert list(errors.keys()) == [(tmp_path / 'broken.sigmf-meta').as_posix()]
+    assert len(df) == 2
+    assert list(df['captures.0.core:frequency']) == [1e9, 2e9]
+
+    parsed = []
+    flatten = catalog.flatten_sigmf
+    monkeypatch.setattr(catalog, 'flatten_sigmf', lambda f: parsed.append(f.name) or flatten(f))
+
+    (tmp_path / 'a.sigmf-meta').unlink()
+    write_capture(tmp_path / 'b', frequency=3e9)
+    c.update(tmp_path)
+    df = c.dataframe()
+
+    assert sorted(parsed) == ['b.sigmf-meta', 'broken.sigmf-meta']
+    assert list(df['captures.0.core:frequency']) == [3e9]
+
+
+def test_catalog_parallel_scan(tmp_path, write_capture):
+    for i in range(10):
+        d = tmp_path / f'dir{i % 3}'
+        d.mkdir(exist_ok=True)
+        write_capture(d / f'{i}', frequency=i)
+    (tmp_path / 'broken.sigmf-meta').write_text('{')
+
+    c = catalog.Catalog(tmp_path / 'catalog.sqlite')
+    progress = list(c.scan(tmp_path, jobs=2, chunksize=4))
+
+    assert [p['parsed'] for p in progress] == [4, 8, 11]
+    assert [p['commits'] for p in progress] == [2, 3, 4]
+    assert len(progress[-1]['errors']) == 1
+    assert sorted(c.dataframe()['captures.0.core:frequency']) == list(range(10))
+
+
+def test_catalog_scan_removed(tmp_path, write_capture):
+    write_capture(tmp_path / 'a')
+    write_capture(tmp_path / 'b')
+    c = catalog.Catalog(tmp_path / 'catalog.sqlite')
+    c.update(tmp_path)
+
+    # removing files is reported as a commit, even if nothing is parsed
+    (tmp_path / 'a.sigmf-meta').unlink()
+    progress = list(c.scan(tmp_path))
+
+    assert progress == [{'total': 0, 'parsed': 0, 'errors': {}, 'commits': 1}]
+    assert len(c.dataframe()) == 1
+
+    write_capture(tmp_path / 'c')
+    (tmp_path / 'b.sigmf-meta').unlink()
+    progress = list(c.scan(tmp_path))
+
+    assert [(p['parsed'], p['commits']) for p in progress] == [(0, 1), (1, 2)]
+
+
+def test_flatten_segments(tmp_path, write_capture):
+    captures = [
+        {'core:sample_start': 1000, 'core:frequency': 2e9},
+        {'core:sample_start': 0, 'core:frequency': 1e9},
+    ]
+    m = catalog.flatten_sigmf(write_capture(tmp_path / 'a', captures=captures))
+    assert m['captures.0']['core:frequency'] == 1e9
+    assert m['segments'] == 2
+    assert m['frequency'] == {'min': 1e9, 'max': 2e9}
+
+
+def test_catalog_shared(tmp_path, write_capture):
+    # 'a' is a prefix of 'ab', but not one of its parent directories
+    for name, frequency in (('a', 1e9), ('ab', 2e9)):
+        (tmp_path / name).mkdir()
+        write_capture(tmp_path / name / 'capture', frequency=frequency)
+
+    c = catalog.Catalog(tmp_path / 'cache' / 'catalog.sqlite')
+    c.update(tmp_path / 'a')
+    c.update(tmp_path / 'ab')
+
+    assert list(c.dataframe(tmp_path / 'a')['captures.0.core:frequency']) == [1e9]
+    assert list(c.dataframe(tmp_path / 'ab')['captures.0.core:frequency']) == [2e9]
+    assert len(c.dataframe()) == 2
+
+
+def test_catalog_version(tmp_path, monkeypatch, write_capture):
+    write_capture(tmp_path / 'a', frequency=1e9)
+    catalog.Catalog(tmp_path / 'catalog.sqlite').update(tmp_path)
+
+    # records of another version are parsed again, even if unmodified
+    monkeypatch.setattr(catalog, 'version', catalog.version + 1)
+    parsed = []
+    flatten = catalog.flatten_sigmf
+    monkeypatch.setattr(catalog, 'flatten_sigmf', lambda f: parsed.append(f.name) or flatten(f))
+
+    c = catalog.Catalog(tmp_path / 'catalog.sqlite')
+    c.update(tmp_path)
+    assert parsed == ['a.sigmf-meta']
+    assert list(c.dataframe()['segments']) == [1]
+
+    parsed.clear()
+    catalog.Catalog(tmp_path / 'catalog.sqlite').update(tmp_path)
+    assert parsed == []
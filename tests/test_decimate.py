@@ -0,0 +1,16 @@
+import numpy as np
+from pyq_engine import utils
+
+
+def test_minmax_decimate():
+    y = np.zeros(100000)
+    y[12345] = 1
+    y[54321] = -1
+
+    idxs = utils.minmax_decimate(y, 1000)
+
+    assert len(idxs) <= 1000
+    assert 12345 in idxs
+    assert 54321 in idxs
+    assert np.all(np.diff(idxs) > 0)
+    assert np.array_equal(utils.minmax_decimate(y[:10], 1000), np.arange(10))
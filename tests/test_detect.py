@@ -0,0 +1,51 @@
+import numpy as np
+from pyq_engine import utils
+
+
+def test_detect_bursts():
+    freqs = np.linspace(-50, 50, 101)
+    times = np.arange(4) * 0.1
+    spectrogram = np.full((4, 101), -100.0)
+    spectrogram[1, 10:20] = -50
+    spectrogram[1, 15] = -40
+    spectrogram[1, 90:] = -60
+    spectrogram[3, :2] = -70
+
+    detections = utils.detect_bursts(freqs, times, spectrogram)
+
+    assert detections.dtype == utils.detection_dtype
+    assert np.allclose(detections['time'], [0.1, 0.1, 0.3])
+    assert np.allclose(detections['freq'], [-35.5, 45, -49.5])
+    assert np.allclose(detections['bandwidth'], [10, 11, 2])
+    assert np.allclose(detections['dB'], [-40, -60, -70])
+
+
+def test_detect_bursts_min_bandwidth():
+    freqs = np.linspace(-50, 50, 101)
+    spectrogram = np.full((2, 101), -100.0)
+    spectrogram[0, 10:20] = -50
+    spectrogram[1, 50] = -50
+
+    detections = utils.detect_bursts(freqs, np.arange(2), spectrogram, min_bandwidth=5)
+
+    assert len(detections) == 1
+    assert detections[0]['time'] == 0
+
+
+def test_detect_bursts_empty():
+    freqs = np.linspace(-50, 50, 101)
+    assert len(utils.detect_bursts(freqs, np.arange(2), np.zeros((2, 101)))) == 0
+    assert len(utils.detect_bursts(freqs, np.empty(0), np.empty((0, 101)))) == 0
+
+
+def test_annotated():
+    detections = np.zeros(3, dtype=utils.detection_dtype)
+    detections['time'] = [0.1, 0.5, 0.5]
+    detections['freq'] = [10, 10, 40]
+    annotations = [
+        {'core:sample_start': 0, 'core:sample_count': 20},
+        {'core:sample_start': 40, 'core:freq_lower_edge': 0, 'core:freq_upper_edge': 20},
+    ]
+
+    assert list(utils.annotated(detections, annotations, 100)) == [True, True, False]
+    assert not utils.annotated(detections, [], 100).any()
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from pyq_engine.tools import explorer
+
+
+def test_get_rows():
+    df = pd.DataFrame({
+        'index': range(10),
+        'name': [f'rx{i % 3}' for i in range(10)],
+        'frequency': [i * 1e6 for i in range(10)],
+        'extra': [np.nan] * 10,
+    })
+
+    request = {
+        'startRow': 1,
+        'endRow': 3,
+        'sortModel': [{'colId': 'frequency', 'sort': 'desc'}],
+        'filterModel': {
+            'name': {'filterType': 'text', 'type': 'contains', 'filter': 'RX1'},
+            'frequency': {
+                'filterType': 'number',
+                'operator': 'OR',
+                'conditions': [
+                    {'filterType': 'number', 'type': 'lessThan', 'filter': 2e6},
+                    {'filterType': 'number', 'type': 'greaterThan', 'filter': 5e6},
+                ],
+            },
+        },
+    }
+
+    response = explorer.get_rows(df, request, ['index', 'frequency', 'missing'])
+
+    # rows 1, 7 match, sorted by decreasing frequency
+    assert response['rowCount'] == 2
+    assert response['rowData'] == [{'index': 1, 'frequency': 1e6}]
+
+
+def test_column_fields():
+    column_defs = [
+        {'field': 'a'},
+        {'headerName': 'group', 'children': [{'field': 'b'}, {'field': 'c'}]},
+    ]
+    assert explorer.column_fields(column_defs) == ['a', 'b', 'c']
@@ -0,0 +1,48 @@
+import diskcache
+import flask
+import pytest
+from pyq_engine import metrics
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'store', diskcache.Cache(tmp_path.as_posix()))
+
+
+def test_collect():
+    metrics.observe('pyq_engine_stage_seconds', 'psd', 0.02)
+    metrics.observe('pyq_engine_stage_seconds', 'psd', 3)
+    metrics.cache_lookup('tiles', True)
+    metrics.cache_lookup('tiles', False)
+    metrics.cache_lookup('tiles', True)
+
+    m = metrics.collect()
+
+    h = m['pyq_engine_stage_seconds']['psd']
+    assert h['count'] == 2
+    assert h['sum'] == pytest.approx(3.02)
+    assert h['buckets'][0.01] == 0
+    assert h['buckets'][0.025] == 1
+    assert h['buckets'][5] == 2
+    assert h['buckets'][float('inf')] == 2
+    assert m['pyq_engine_cache_hits_total'] == {'tiles': 2}
+    assert m['pyq_engine_cache_misses_total'] == {'tiles': 1}
+
+
+def test_endpoint():
+    app = flask.Flask(__name__)
+    app.register_blueprint(metrics.blueprint)
+
+    @app.route('/_dash-update-component', methods=['POST'])
+    def update():
+        return 'x' * 100
+
+    c = app.test_client()
+    with metrics.timer('figure.iq'):
+        c.post('/_dash-update-component', json={'output': 'graph.figure'})
+    text = c.get('/metrics').get_data(as_text=True)
+
+    assert '# TYPE pyq_engine_callback_seconds histogram' in text
+    assert 'pyq_engine_callback_seconds_count{callback="graph.figure"} 1' in text
+    assert 'pyq_engine_callback_response_bytes_total{callback="graph.figure"} 100' in text
+    assert 'pyq_engine_stage_seconds_bucket{stage="figure.iq",le="+Inf"} 1' in text
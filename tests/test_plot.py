@@ -0,0 +1,115 @@
+import json
+import diskcache
+import numpy as np
+import plotly.graph_objs as go
+import plotly.io
+from pyq_engine import cache
+from pyq_engine.capture import Capture
+from pyq_engine.components import plot
+from pyq_engine.pyramid import SpectrogramPyramid
+
+
+def test_spectrogram_annotations():
+    frequency = np.linspace(-5e5, 5e5, 64)
+    annotations = [
+        {'core:sample_start': 0, 'core:sample_count': 100, 'core:label': 'before'},
+        {'core:sample_start': 900, 'core:sample_count': 200, 'core:freq_lower_edge': 1e9, 'core:freq_upper_edge': 1e9 + 1e5, 'core:label': 'a'},
+        {'core:sample_start': 1500, 'core:label': 'b'},
+        {'core:sample_start': 5000, 'core:sample_count': 10},
+    ]
+    fig = go.Figure()
+
+    plot.draw_spectrogram_annotations(fig, annotations, frequency, 1e6, 1000, 2000, offset=1e9)
+
+    assert len(fig.data) == 1
+    trace = fig.data[0]
+    assert len(trace.x) == 2 * 6
+    assert np.allclose(trace.x[:5], [0, 0, 1e5, 1e5, 0])
+    assert np.allclose(trace.y[:5], [1e-3, 1.1e-3, 1.1e-3, 1e-3, 1e-3])
+    assert np.allclose(trace.x[6:11], [-5e5, -5e5, 5e5, 5e5, -5e5])
+    assert np.allclose(trace.y[6:11], [1.5e-3, 2e-3, 2e-3, 1.5e-3, 1.5e-3])
+    assert list(trace.text[::6]) == ['a', 'b']
+
+
+def test_spectrogram_annotations_none_visible():
+    fig = go.Figure()
+    plot.draw_spectrogram_annotations(fig, [{'core:sample_start': 0, 'core:sample_count': 10}], np.arange(4), 1e6, 100, 200)
+    assert len(fig.data) == 0
+
+
+def test_quantize():
+    values = np.array([[-100, -50, 0], [np.nan, -np.inf, -75]])
+
+    q, (vmin, vmax) = plot.quantize(values)
+
+    assert q.dtype == np.uint8
+    assert (vmin, vmax) == (-100, 0)
+    assert q.tolist() == [[0, 127, 255], [0, 0, 64]]
+
+
+def test_frequencies_typed_arrays():
+    metadata = {'global': {'core:sample_rate': 1e6}}
+    samples = np.random.randn(4096).astype(np.complex64)
+
+    fig = plot.frequencies(samples, metadata, fc=1e9, nperseg=256)
+    trace = json.loads(plotly.io.to_json(fig))['data'][0]
+
+    assert 'x' not in trace
+    assert trace['x0'] == 1e9 - 5e5
+    assert trace['y']['dtype'] == 'f4'
+    assert 'bdata' in trace['y']
+
+
+def test_chunked_views(tmp_path, monkeypatch, write_capture):
+    samples = (np.random.randn(10000) + 1j * np.random.randn(10000)).astype(np.complex64)
+    samples = Capture.open(write_capture(tmp_path / 'capture', samples))
+    metadata = samples.metadata
+
+    time = plot.time(samples, metadata, max_points=100)
+    iq = plot.IQ(samples, bins=32)
+    monkeypatch.setattr(plot, 'chunk_size', 1000)
+
+    for a, b in zip(time.data, plot.time(samples, metadata, max_points=100).data):
+        assert np.array_equal(a.x, b.x)
+        assert np.array_equal(a.y, b.y)
+    assert np.array_equal(iq.data[0].z, plot.IQ(samples, bins=32).data[0].z, equal_nan=True)
+
+
+def test_iq_full_scale(tmp_path, write_capture):
+    # integer samples are shown against their full scale, not their maximum
+    samples = np.full(200, 2**13, dtype='<i2')
+    capture = Capture.open(write_capture(tmp_path / 'capture', samples, 'ci16_le'))
+
+    z = plot.IQ(capture, bins=4).data[0].z
+    assert z[2, 2] == 100
+    assert np.isnan(z[3, 3])
+
+
+def test_spectrogram_segments(tmp_path, monkeypatch, write_capture):
+    monkeypatch.setattr(cache, 'tiles', diskcache.Cache((tmp_path / 'tiles').as_posix()))
+
+    # retuned from 1GHz to 2GHz half way, with a tone at +300kHz after it
+    t = np.arange(8192) / 1e6
+    samples = 0.01 * np.random.default_rng(0).standard_normal(8192) + np.where(t >= 4096e-6, np.exp(2j * np.pi * 300e3 * t), 0)
+    captures = [{'core:sample_start': 0, 'core:frequency': 1e9}, {'core:sample_start': 4096, 'core:frequency': 2e9}]
+    annotations = [
+        {'core:sample_start': 1024, 'core:sample_count': 1024, 'core:freq_lower_edge': 1e9 + 1e5, 'core:freq_upper_edge': 1e9 + 2e5},
+        {'core:sample_start': 5120, 'core:sample_count': 1024, 'core:freq_lower_edge': 2e9 - 2e5, 'core:freq_upper_edge': 2e9 - 1e5},
+        {'core:sample_start': 3072, 'core:sample_count': 2048},
+    ]
+    capture = Capture.open(write_capture(tmp_path / 'capture', samples.astype(np.complex64), captures=captures, annotations=annotations))
+    pyramid = SpectrogramPyramid(capture, 'segments', 256)
+
+    for rf_freq, fcs in ((True, [1e9, 2e9]), (False, [0, 0])):
+        fig = plot.spectrogram(pyramid, capture.metadata, 0, len(capture), segments=capture.segments(), rf_freq=rf_freq, analyze=True)
+        heatmaps = [d for d in fig.data if d.type == 'heatmap']
+        rectangles = next(d for d in fig.data if d.name == 'annotations').x.reshape(-1, 6)
+        detections = next(d for d in fig.data if d.name == 'detection')
+
+        assert [h.x0 for h in heatmaps] == [fc - 5e5 for fc in fcs]
+        assert [h.y0 for h in heatmaps] == [0, 4096e-6]
+        assert np.allclose(rectangles[0, [0, 2]], [fcs[0] + 1e5, fcs[0] + 2e5])
+        assert np.allclose(rectangles[1, [0, 2]], [fcs[1] - 2e5, fcs[1] - 1e5])
+        # the annotation spanning the retune covers the band of each segment
+        assert np.allclose(rectangles[2:, [0, 2]], [[fcs[0] - 5e5, fcs[0] + 5e5], [fcs[1] - 5e5, fcs[1] + 5e5]])
+        assert np.isclose(detections.x[np.argmax(detections.customdata[:, 1])], fcs[1] + 300e3, atol=2e6 / 256)
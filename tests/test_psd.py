@@ -0,0 +1,35 @@
+import numpy as np
+from scipy import signal
+from pyq_engine import utils
+
+
+def welch_psd(samples, nperseg):
+    _, psd = signal.welch(samples, fs=1e6, scaling='spectrum', return_onesided=False, nperseg=nperseg)
+    return 10 * np.log10(np.fft.fftshift(psd) / len(psd))
+
+
+def test_samples_to_psd_matches_welch():
+    samples = np.random.rand(2 * 10000).view(dtype=np.complex128)
+
+    f, psd = utils.samples_to_psd(samples, 1e6, fc=1e9, nperseg=256)
+
+    assert np.allclose(psd, welch_psd(samples, 256))
+    assert f[0] == 1e9 - 0.5e6
+
+
+def test_stream_psd_chunks():
+    samples = np.random.rand(2 * 10000).view(dtype=np.complex128)
+
+    results = list(utils.stream_psd(samples, 1e6, nperseg=256, chunk_size=999))
+
+    assert len(results) == 11
+    assert np.allclose(results[-1][1], welch_psd(samples, 256))
+    assert np.allclose(results[0][1], welch_psd(samples[:999], 256))
+
+
+def test_samples_to_psd_short():
+    samples = np.random.rand(2 * 100).view(dtype=np.complex128)
+
+    f, psd = utils.samples_to_psd(samples, 1e6, nperseg=256)
+
+    assert len(f) == len(psd) == 100
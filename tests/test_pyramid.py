@@ -0,0 +1,41 @@
+import diskcache
+import numpy as np
+import pytest
+from pyq_engine import cache, utils
+from pyq_engine.pyramid import SpectrogramPyramid
+
+
+@pytest.fixture(autouse=True)
+def tiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'tiles', diskcache.Cache(tmp_path.as_posix()))
+
+
+def test_pyramid_level0_matches_spectrogram():
+    samples = np.random.rand(2 * 64 * 100).view(dtype=np.complex128)
+    pyramid = SpectrogramPyramid(samples, 'level0', nperseg=64, tile_rows=16)
+
+    f, t, spectrogram = pyramid.get(0, len(samples), 1e6, max_rows=100)
+    ref_f, ref = utils.sigmf_to_spectrogram(samples, 1e6, nperseg=64)
+
+    assert np.allclose(f, ref_f)
+    assert np.allclose(spectrogram, ref, atol=1e-4)
+    assert np.allclose(t, np.arange(100) * 64 / 1e6)
+
+
+def test_pyramid_bounded_rows():
+    samples = np.random.rand(2 * 64 * 1000).view(dtype=np.complex128)
+    pyramid = SpectrogramPyramid(samples, 'bounded', nperseg=64, tile_rows=16)
+    _, ref = utils.sigmf_to_spectrogram(samples, 1e6, nperseg=64)
+
+    progress = []
+    _, t, spectrogram = pyramid.get(0, len(samples), 1e6, max_rows=100, progress=lambda *p: progress.append(p))
+
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    # 1000 rows pooled 16 at a time
+    assert spectrogram.shape == (63, 64)
+    assert np.allclose(spectrogram[0], ref[:16].max(axis=0), atol=1e-4)
+    assert t[1] == 16 * 64 / 1e6
+
+    _, t, spectrogram = pyramid.get(64 * 500, 64 * 600, 1e6, max_rows=100)
+    assert spectrogram.shape == (100, 64)
+    assert np.allclose(spectrogram, ref[500:600], atol=1e-4)
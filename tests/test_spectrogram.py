@@ -0,0 +1,23 @@
+import numpy as np
+from pyq_engine import utils
+
+
+def test_spectrogram_matches_psd():
+    samples = np.random.rand(2 * 1000).view(dtype=np.complex128)
+    nperseg = 64
+
+    f, spectrogram = utils.sigmf_to_spectrogram(samples, 1e6, nperseg=nperseg, fc=1e9)
+
+    assert spectrogram.shape == (len(samples) // nperseg, nperseg)
+    for i, row in enumerate(spectrogram):
+        ref_f, ref = utils.samples_to_psd(samples[i * nperseg:(i + 1) * nperseg], 1e6, fc=1e9, nperseg=nperseg)
+        assert np.allclose(row, ref)
+    assert np.allclose(f, ref_f)
+
+
+def test_spectrogram_overlap():
+    samples = np.random.rand(2 * 1000).view(dtype=np.complex128)
+
+    _, spectrogram = utils.sigmf_to_spectrogram(samples, 1e6, nperseg=64, noverlap=48)
+
+    assert spectrogram.shape == ((len(samples) - 64) // 16 + 1, 64)
@@ -0,0 +1,78 @@
+import threading
+
+import flask
+from pyq_engine import cache, upload
+
+
+def test_chunked_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'spool_dir', tmp_path)
+    app = flask.Flask(__name__)
+    app.register_blueprint(upload.blueprint)
+    client = app.test_client()
+
+    data = bytes(range(256)) * 10
+    info = {'name': 'test.sigmf', 'size': len(data), 'modified': 0}
+
+    status = client.post('/upload', json=info).json
+    assert status['offset'] == 0
+    assert not status['done']
+
+    key = status['key']
+    status = client.put(f'/upload/{key}?offset=0&size={len(data)}', data=data[:1000]).json
+    assert status == {'key': key, 'offset': 1000, 'done': False}
+
+    # resuming returns the current offset, out of order chunks are refused
+    assert client.post('/upload', json=info).json['offset'] == 1000
+    r = client.put(f'/upload/{key}?offset=0&size={len(data)}', data=data[:1000])
+    assert r.status_code == 409
+    assert r.json['offset'] == 1000
+
+    status = client.put(f'/upload/{key}?offset=1000&size={len(data)}', data=data[1000:]).json
+    assert status['done']
+    assert cache.spool_path(key).read_bytes() == data
+    assert client.post('/upload', json=info).json['done']
+
+    assert client.put('/upload/invalid?offset=0&size=1', data=b'').status_code == 404
+
+
+def test_upload_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'spool_dir', tmp_path)
+    app = flask.Flask(__name__)
+    app.register_blueprint(upload.blueprint)
+    client = app.test_client()
+
+    key = client.post('/upload', json={'name': 'test.sigmf', 'size': 10, 'modified': 0}).json['key']
+    assert client.put(f'/upload/{key}?offset=0', data=b'').status_code == 400
+    assert client.put(f'/upload/{key}?size=10', data=b'').status_code == 400
+    assert client.put(f'/upload/{"0" * 40}?offset=0&size=10', data=b'').status_code == 404
+
+
+def test_concurrent_upload(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, 'spool_dir', tmp_path)
+    app = flask.Flask(__name__)
+    app.register_blueprint(upload.blueprint)
+
+    data = bytes(range(256)) * 40
+    info = {'name': 'test.sigmf', 'size': len(data), 'modified': 0}
+    key = app.test_client().post('/upload', json=info).json['key']
+
+    # the same file uploaded from several tabs, only one of the chunks is
+    # written, the others are told where to resume from
+    barrier = threading.Barrier(8)
+    responses = []
+
+    def put():
+        client = app.test_client()
+        barrier.wait()
+        responses.append(client.put(f'/upload/{key}?offset=0&size={len(data)}', data=data))
+
+    threads = [threading.Thread(target=put) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(r.status_code for r in responses) == [200] + [409] * 7
+    assert all(r.json == {'key': key, 'offset': len(data), 'done': True} for r in responses)
+    assert cache.spool_path(key).read_bytes() == data
+    assert not cache.spool_path(key, '.part').exists()